@@ -5,10 +5,12 @@ import traceback
 from django import forms
 from django.contrib import admin
 from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.shortcuts import redirect
 from django.template.response import TemplateResponse
 from django.urls import re_path
+from django.utils.http import urlencode
 from django.utils.translation import gettext_lazy as _
 
 # soft import reversion - since it is not a hard
@@ -19,7 +21,12 @@ except ImportError:
     reversion = None
 
 # we only support reversion at this point
-from django_handleref.version import ReversionReverter, ReversionVersion
+from django_handleref.version import (
+    HistoryDiff,
+    ReversionReverter,
+    ReversionVersion,
+    ReversionVersionChain,
+)
 
 logger = logging.getLogger("django")
 
@@ -47,6 +54,7 @@ class VersionAdmin(admin.ModelAdmin):
     # set to reversion as default
 
     version_cls = ReversionVersion
+    version_chain_cls = ReversionVersionChain
     reverter_cls = ReversionReverter
 
     # display these fields in the object history listing
@@ -119,10 +127,80 @@ class VersionAdmin(admin.ModelAdmin):
         # so it's ok for now
 
         history_qset = reversion.models.Version.objects.get_for_object(instance)
+        history_qset = history_qset.select_related("revision", "revision__user")
+        history_qset = history_qset.only(*self.history_query_fields())
         history_qset = history_qset.order_by("-revision_id")
         return history_qset
 
-    def history_entry(self, version, previous):
+    def history_query_fields(self):
+        """
+        Returns:
+
+            - list: version fields to load for the history listing
+              depending on `version_list_fields`
+
+        """
+
+        fields = [
+            "id",
+            "content_type",
+            "object_id",
+            "db",
+            "revision__id",
+            "revision__date_created",
+            "revision__comment",
+            "revision__user",
+        ]
+
+        # the serialized snapshot is only needed if object data
+        # is listed or diffed
+
+        needs_data = self.history_object_fields() or self.history_lists_field(
+            "version_data", "version_data_sorted"
+        )
+
+        if needs_data or self.history_lists_changes():
+            fields.extend(["format", "serialized_data"])
+
+        return fields
+
+    def history_object_fields(self):
+        """
+        Returns:
+
+            - list: object fields listed in `version_list_fields`
+
+        """
+
+        return [
+            field
+            for field, label in self.version_list_fields
+            if field.find("version_") != 0
+        ]
+
+    def history_lists_changes(self):
+        """
+        Returns:
+
+            - bool: True if `version_list_fields` lists the changes
+              of a version
+
+        """
+
+        return self.history_lists_field("version_changes", "version_changed_fields")
+
+    def history_lists_field(self, *names):
+        """
+        Returns:
+
+            - bool: True if `version_list_fields` lists any of the
+              specified fields
+
+        """
+
+        return any(field in names for field, label in self.version_list_fields)
+
+    def history_entry(self, version, previous, changes=None):
         """
         Compile object history list entry dict
 
@@ -132,6 +210,11 @@ class VersionAdmin(admin.ModelAdmin):
             - previous(handleref.version.Version): older version
               if no older version exists will be an empty Version instance
 
+        Keyword Argument(s):
+
+            - changes(dict): precomputed changes between previous and
+              version, computed if not specified
+
         Returns:
 
             - dict: {"id","fields","comment"}
@@ -141,15 +224,26 @@ class VersionAdmin(admin.ModelAdmin):
         fields = []
         entry = {"id": version.id, "fields": fields, "comment": version.comment}
 
+        # only decode the object fields that are listed
+
+        object_fields = self.history_object_fields()
+        data = version.data_fields(object_fields) if object_fields else {}
+
         for field, label in self.version_list_fields:
             if field == "version_changes":
-                fields.append((field, version.changes(previous)))
+                if changes is None:
+                    changes = version.changes(previous)
+                fields.append((field, changes))
             elif field == "version_changed_fields":
-                fields.append((field, version.changed_fields(previous)))
+                if changes is None:
+                    changes = version.changes(previous)
+                fields.append(
+                    (field, None if changes is None else sorted(changes.keys()))
+                )
             elif field.find("version_") == 0:
                 fields.append((field, getattr(version, field.split("_")[1])))
             else:
-                fields.append((field, version.data.get(field, "")))
+                fields.append((field, data.get(field, "")))
         return entry
 
     def history(self, history_qset):
@@ -168,19 +262,33 @@ class VersionAdmin(admin.ModelAdmin):
 
         history = []
 
-        versions = [v for v in history_qset]
+        versions = [self.version_cls(v) for v in history_qset]
 
         versions.reverse()
 
         # If there are no previous versions, return an empty history
         if not versions:
             return history
-        previous = self.version_cls(versions[0]).previous
 
-        for _version in versions:
-            version = self.version_cls(_version)
-            history.insert(0, self.history_entry(version, previous))
-            previous = version
+        # previous versions and diffs are only needed if changes
+        # are listed
+
+        if not self.history_lists_changes():
+            for version in versions:
+                history.insert(0, self.history_entry(version, None))
+            return history
+
+        # link previous versions and load persisted changes in batch
+        self.version_chain_cls.link(versions)
+        self.version_cls.prefetch_changes(versions)
+
+        # compute all diffs in one pass
+        diffs = HistoryDiff(versions, previous=versions[0].previous).changes
+
+        for version, changes in zip(versions, diffs):
+            history.insert(
+                0, self.history_entry(version, version.previous, changes=changes)
+            )
 
         return history
 
@@ -204,7 +312,7 @@ class VersionAdmin(admin.ModelAdmin):
             return self.version_revert_view(request, object_id)
 
         history_qset = self.history_query_set(object_id)
-        listing = HistoryListing(self, request, history_qset)
+        listing = HistoryListing(self, request, history_qset, object_id=object_id)
         history = self.history(listing.result_list)
 
         context = dict(
@@ -233,6 +341,7 @@ class VersionAdmin(admin.ModelAdmin):
             return redirect("admin:login")
 
         version = self.version_cls(reversion.models.Version.objects.get(id=version_id))
+        self.version_chain_cls.link([version])
         previous = version.previous
         context = dict(
             self.admin_site.each_context(request),
@@ -423,28 +532,87 @@ class HistoryListing(ChangeList):
     """
     History listing view derived from how django admin does it's
     ChangeList. This is mostly so we can support pagination
-    """
 
-    def __init__(self, model_admin, request, qset):
-        try:
-            self.page_num = int(request.GET.get("p", 1))
-        except ValueError:
-            self.page_num = 1
+    Pagination is keyset based on `revision_id` using the `before`
+    and `after` request parameters, so no page requires a COUNT
+    or OFFSET query. The total shown is counted once and then
+    cached for `count_cache_timeout` seconds.
+    """
 
-        self.list_per_page = 100
-        self.paginator = model_admin.get_paginator(request, qset, self.list_per_page)
+    list_per_page = 100
+    count_cache_timeout = 300
 
-        result_count = self.paginator.count
+    def __init__(self, model_admin, request, qset, object_id=None):
+        self.model_admin = model_admin
         self.show_all = False
         self.can_show_all = False
-        self.result_count = result_count
-        self.full_result_count = qset.count()
-        self.multi_page = result_count > self.list_per_page
-
-        self.result_list = self.paginator.page(self.page_num).object_list
 
         self.params = dict(request.GET.items())
-        if "p" in self.params:
-            del self.params["p"]
-        if "e" in self.params:
-            del self.params["e"]
+        for param in ["p", "e", "before", "after"]:
+            if param in self.params:
+                del self.params[param]
+
+        before = self.get_cursor(request, "before")
+        after = self.get_cursor(request, "after")
+        per_page = self.list_per_page
+
+        if after is not None:
+            # newer page, fetch ascending and flip
+            rows = list(
+                qset.filter(revision_id__gt=after).order_by("revision_id")[
+                    : per_page + 1
+                ]
+            )
+            self.has_newer = len(rows) > per_page
+            rows = rows[:per_page]
+            rows.reverse()
+            self.has_older = True
+        else:
+            if before is not None:
+                qset_page = qset.filter(revision_id__lt=before)
+            else:
+                qset_page = qset
+            rows = list(qset_page.order_by("-revision_id")[: per_page + 1])
+            self.has_older = len(rows) > per_page
+            rows = rows[:per_page]
+            self.has_newer = before is not None
+
+        if rows:
+            self.newer_query = self.get_query_string({"after": rows[0].revision_id})
+            self.older_query = self.get_query_string({"before": rows[-1].revision_id})
+        else:
+            self.has_newer = self.has_older = False
+
+        self.result_list = rows
+        self.result_count = self.full_result_count = self.get_count(qset, object_id)
+        self.multi_page = self.has_newer or self.has_older
+
+    def get_cursor(self, request, name):
+        try:
+            return int(request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    def get_query_string(self, new_params=None, remove=None):
+        params = dict(self.params)
+        params.update(new_params or {})
+        for key in remove or []:
+            params.pop(key, None)
+        return "?%s" % urlencode(sorted(params.items()))
+
+    def get_count(self, qset, object_id):
+        """
+        Return the total number of versions in the history, cached
+        per object
+        """
+
+        if object_id is None:
+            return qset.count()
+
+        opts = self.model_admin.model._meta
+        key = f"handleref.history_count.{opts.label_lower}.{object_id}"
+        count = cache.get(key)
+        if count is None:
+            count = qset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
@@ -0,0 +1,145 @@
+import datetime
+import functools
+import hashlib
+
+from django.db import models
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from django_handleref.manager import last_change_expression
+
+
+def make_etag(*parts):
+    """
+    Returns a weak ETag built from a hash of parts
+    """
+
+    value = ":".join(str(part) for part in parts)
+    return 'W/"{}"'.format(hashlib.md5(value.encode("utf-8")).hexdigest())
+
+
+def collection_state(queryset):
+    """
+    Returns (etag, last_modified) for the objects in a queryset, computed
+    with a single aggregate query over `created`, `updated` and the number
+    of objects
+
+    The number of objects is part of the ETag so removing objects from
+    the collection (hard delete, changed filters) changes it as well.
+    """
+
+    state = queryset.order_by().aggregate(
+        last_change=last_change_expression(), count=models.Count("pk")
+    )
+    last_change = state["last_change"]
+    etag = make_etag(
+        queryset.model._meta.label_lower,
+        state["count"],
+        last_change.isoformat() if last_change else "",
+    )
+    return (etag, last_change)
+
+
+def object_state(queryset):
+    """
+    Returns (etag, last_modified) for the single object in a queryset
+    from its `version` and `updated` fields, (None, None) if the
+    queryset is empty
+    """
+
+    row = queryset.order_by().values_list("pk", "version", "updated").first()
+    if row is None:
+        return (None, None)
+    pk, version, updated = row
+    etag = make_etag(queryset.model._meta.label_lower, pk, version, updated.isoformat())
+    return (etag, updated)
+
+
+def conditional_response(request, etag, last_modified):
+    """
+    Returns a 304 (Not Modified) response if the request's
+    If-None-Match / If-Modified-Since headers match, None otherwise
+    """
+
+    if request.method not in ("GET", "HEAD"):
+        return None
+
+    return get_conditional_response(
+        request, etag=etag, last_modified=http_timestamp(last_modified)
+    )
+
+
+def set_conditional_headers(request, response, etag, last_modified):
+    """
+    Sets the ETag and Last-Modified headers on a response to a GET / HEAD
+    request unless already set
+    """
+
+    if request.method not in ("GET", "HEAD"):
+        return
+
+    if last_modified and not response.has_header("Last-Modified"):
+        response["Last-Modified"] = http_date(http_timestamp(last_modified))
+    if etag and not response.has_header("ETag"):
+        response["ETag"] = etag
+
+
+def http_timestamp(value):
+    """
+    Returns a datetime as integer unix timestamp, naive datetimes are
+    treated as UTC (same as django's `condition` decorator)
+    """
+
+    if not value:
+        return None
+    if not timezone.is_aware(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return int(value.timestamp())
+
+
+def condition(queryset, lookup_url_kwarg=None, lookup_field="pk"):
+    """
+    View decorator answering conditional GET requests for HandleRef
+    collections or objects with 304 before the view runs
+
+    Arguments:
+
+    queryset <QuerySet|callable> the collection served by the view, if
+    callable it is called with the view arguments (request, *args, **kwargs)
+    and should return the queryset
+
+    lookup_url_kwarg <str=None> if specified the view serves a single object
+    identified by this url keyword argument, otherwise the whole collection
+
+    lookup_field <str="pk"> model field the url keyword argument is
+    matched against
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return func(request, *args, **kwargs)
+
+            if callable(queryset):
+                qset = queryset(request, *args, **kwargs)
+            else:
+                qset = queryset.all()
+
+            if lookup_url_kwarg:
+                qset = qset.filter(**{lookup_field: kwargs[lookup_url_kwarg]})
+                etag, last_modified = object_state(qset)
+            else:
+                etag, last_modified = collection_state(qset)
+
+            response = conditional_response(request, etag, last_modified)
+            if response is None:
+                response = func(request, *args, **kwargs)
+
+            set_conditional_headers(request, response, etag, last_modified)
+            return response
+
+        return inner
+
+    return decorator
@@ -0,0 +1,47 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from django_handleref.models import HandleRefModel, registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify that `updated` is never older than `created` for HandleRef "
+        "models. The strict `since()` mode relies on this."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="models to check as app_label.ModelName, defaults to all "
+            "HandleRef models",
+        )
+
+    def handle(self, *args, **options):
+        if options.get("models"):
+            check_models = [apps.get_model(label) for label in options["models"]]
+        else:
+            check_models = registry.models()
+
+        failed = 0
+
+        for model in check_models:
+            if not issubclass(model, HandleRefModel):
+                raise CommandError(f"{model._meta.label} is not a HandleRef model")
+
+            count = model._base_manager.filter(updated__lt=models.F("created")).count()
+
+            if count:
+                failed += 1
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"{model._meta.label}: {count} object(s) updated before created"
+                    )
+                )
+            else:
+                self.stdout.write(f"{model._meta.label}: ok")
+
+        if failed:
+            raise CommandError(f"Timestamp check failed for {failed} model(s)")
@@ -0,0 +1,68 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_handleref.models import HandleRefModel, registry
+from django_handleref.snapshot import SnapshotError, check_model, dump
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a compact snapshot of HandleRef model tables, restore it "
+        "with `handleref_load`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="models to dump as app_label.ModelName, defaults to all "
+            "HandleRef models",
+        )
+        parser.add_argument(
+            "-o", "--output", required=True, help="file to write the snapshot to"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="number of rows to fetch and write per chunk",
+        )
+        parser.add_argument(
+            "--database", default="default", help="database to dump from"
+        )
+
+    def handle(self, *args, **options):
+        if options.get("models"):
+            dump_models = [apps.get_model(label) for label in options["models"]]
+        else:
+            # proxy models share their table with the concrete model,
+            # multi table inheritance is not supported by snapshots
+            dump_models = [
+                model
+                for model in registry.models()
+                if not model._meta.proxy and not model._meta.parents
+            ]
+
+        for model in dump_models:
+            if not issubclass(model, HandleRefModel):
+                raise CommandError(f"{model._meta.label} is not a HandleRef model")
+            try:
+                check_model(model)
+            except SnapshotError as exc:
+                raise CommandError(str(exc))
+
+        with open(options["output"], "wb") as fileobj:
+            headers = dump(
+                dump_models,
+                fileobj,
+                batch_size=options["batch_size"],
+                using=options["database"],
+            )
+
+        for header in headers:
+            watermark = header["watermark"]
+            self.stdout.write(
+                "{}: updated {}, version {}".format(
+                    header["model"], watermark["updated"], watermark["version"]
+                )
+            )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_handleref.snapshot import SnapshotError, load
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a snapshot written by `handleref_dump`, prints the watermark "
+        "to continue syncing from with `since()`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="snapshot file to load")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="number of rows to insert per query",
+        )
+        parser.add_argument(
+            "--database", default="default", help="database to load into"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], "rb") as fileobj:
+                result = load(
+                    fileobj,
+                    batch_size=options["batch_size"],
+                    using=options["database"],
+                )
+        except (OSError, SnapshotError) as exc:
+            raise CommandError(f"Unable to load snapshot: {exc}")
+
+        for header, count in result:
+            watermark = header["watermark"]
+            self.stdout.write(
+                "{}: {} row(s), updated {}, version {}".format(
+                    header["model"],
+                    count,
+                    watermark["updated"],
+                    watermark["version"],
+                )
+            )
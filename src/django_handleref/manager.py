@@ -1,8 +1,168 @@
 import datetime
 import numbers
 
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.core import serializers
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, models, transaction
+from django.db.models import Value
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+
+def cascade_relations(model):
+    """
+    Yields a (related model, lookup) tuple for each relation listed
+    in the `delete_cascade` HandleRef option of a model
+
+    The lookup can be used to filter the related model by a list of
+    primary keys of the parent model.
+    """
+
+    for key in model._handleref.delete_cascade:
+        field = model._meta.get_field(key)
+        if field.auto_created and not field.concrete:
+            # reverse relation, filter by the forward field
+            lookup = field.field.name
+        else:
+            lookup = field.related_query_name()
+        yield field.related_model, f"{lookup}__in"
+
+
+# sentinel for cache misses, None is a valid cached last change value
+_cache_miss = object()
+
+
+def last_change_expression():
+    """
+    Returns the aggregate expression for the most recent time an object
+    was either created or updated
+    """
+
+    return Greatest(
+        models.Max("created"),
+        models.Max("updated"),
+        output_field=models.DateTimeField(),
+    )
+
+
+def last_change_cache(model):
+    """
+    Returns the django cache used to store the last change watermark
+    of a model or None if caching is not enabled for the model
+
+    Caching is enabled by setting the `last_change_cache` HandleRef option
+    to the alias of the cache to use
+    """
+
+    alias = model._handleref.last_change_cache
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def last_change_cache_key(model):
+    return f"handleref.last_change.{model._handleref.tag}.{model._meta.label_lower}"
+
+
+def advance_last_change(model, timestamp, using="default"):
+    """
+    Advances the cached last change watermark of a model to timestamp
+    once the current transaction on database `using` is committed
+
+    Does nothing if caching is not enabled for the model, the cache
+    is cold or the cached watermark is more recent already
+    """
+
+    cache = last_change_cache(model)
+    if cache is None or timestamp is None:
+        return
+
+    def advance():
+        key = last_change_cache_key(model)
+        current = cache.get(key, _cache_miss)
+        if current is _cache_miss:
+            return
+        if current is None or timestamp > current:
+            cache.set(key, timestamp)
+
+    # until the commit, concurrent `last_change()` calls still see
+    # the old watermark in the database
+    transaction.on_commit(advance, using=using)
+
+
+def invalidate_last_change(model, using="default"):
+    """
+    Removes the cached last change watermark of a model once the
+    current transaction on database `using` is committed, the next
+    `last_change()` call will query the database again
+
+    Invalidating before the commit would allow a concurrent `last_change()`
+    call to cache the old watermark again.
+    """
+
+    cache = last_change_cache(model)
+    if cache is not None:
+        transaction.on_commit(
+            lambda: cache.delete(last_change_cache_key(model)), using=using
+        )
+
+
+async def async_list(qset):
+    """
+    Evaluates a queryset into a list from async code, using django's
+    async queryset iteration where available (django >= 4.1), otherwise
+    a worker thread
+    """
+
+    if hasattr(qset, "__aiter__"):
+        return [instance async for instance in qset]
+    return await sync_to_async(list)(qset)
+
+
+def last_change_many(models_list):
+    """
+    queries the database for the most recent time an object of any of the
+    specified models was either created or updated
+
+    The per model aggregates are combined with UNION ALL so only a single
+    query is sent to the database.
+
+    Arguments:
+
+    models_list <list> list of HandleRefModel classes or HandleRefQuerySet instances
+
+    returns datetime or None if all models are empty
+    """
+
+    qsets = []
+    for model in models_list:
+        if isinstance(model, HandleRefQuerySet):
+            qset = model
+        else:
+            qset = HandleRefQuerySet(model)
+        # group by a constant so the aggregate can be used as a
+        # (single row) subquery of the union
+        qsets.append(
+            qset.order_by()
+            .annotate(_group=Value(1))
+            .values("_group")
+            .annotate(last_change=last_change_expression())
+            .values_list("last_change", flat=True)
+        )
+
+    if not qsets:
+        return None
+
+    qset = qsets[0]
+    if len(qsets) > 1:
+        qset = qset.union(*qsets[1:], all=True)
+
+    values = [value for value in qset if value is not None]
+    if not values:
+        return None
+    return max(values)
 
 
 class HandleRefQuerySet(models.QuerySet):
@@ -18,16 +178,26 @@ class HandleRefQuerySet(models.QuerySet):
 
         returns datetime or None if db is empty
         """
-        try:
-            cdt = self.latest("created")
-            udt = self.latest("updated")
-            # print cdt, udt
-            return max(cdt.created, udt.updated)
 
-        except ObjectDoesNotExist:
-            return None
+        return self.order_by().aggregate(last_change=last_change_expression())[
+            "last_change"
+        ]
 
-    def since(self, timestamp=None, version=None, deleted=False):
+    async def alast_change(self):
+        """
+        Async version of `last_change`
+
+        Uses django's async aggregate where available (django >= 4.2),
+        otherwise runs the query in a worker thread
+        """
+
+        qset = self.order_by()
+        if hasattr(qset, "aaggregate"):
+            result = await qset.aaggregate(last_change=last_change_expression())
+            return result["last_change"]
+        return await sync_to_async(qset.last_change)()
+
+    def since(self, timestamp=None, version=None, deleted=False, strict=None):
         """
         Queries the database for objects updated since timestamp or version
 
@@ -41,18 +211,30 @@ class HandleRefQuerySet(models.QuerySet):
 
         deleted <bool=False> if true include soft-deleted objects in the result
 
+        strict <bool=None> if true only filter the timestamp against `updated`,
+        relying on `updated` never being older than `created`. This allows
+        the filter to use a single index. Defaults to the `since_strict`
+        HandleRef option. Use the `handleref_check_timestamps` management
+        command to verify the invariant holds for existing data.
+
         Either timestamp or version needs to be provided
         """
 
         qset = self
 
+        if strict is None:
+            strict = self.model._handleref.since_strict
+
         if timestamp is not None:
             if isinstance(timestamp, numbers.Real):
                 timestamp = datetime.datetime.fromtimestamp(timestamp)
 
-            qset = qset.filter(
-                models.Q(created__gt=timestamp) | models.Q(updated__gt=timestamp)
-            )
+            if strict:
+                qset = qset.filter(updated__gt=timestamp)
+            else:
+                qset = qset.filter(
+                    models.Q(created__gt=timestamp) | models.Q(updated__gt=timestamp)
+                )
 
         if version is not None:
             qset = qset.filter(version__gt=version)
@@ -62,6 +244,245 @@ class HandleRefQuerySet(models.QuerySet):
 
         return qset
 
+    def since_iter(
+        self,
+        timestamp=None,
+        version=None,
+        deleted=False,
+        strict=None,
+        batch_size=1000,
+        cursor=None,
+    ):
+        """
+        Generator that streams objects updated since timestamp or version
+        in batches, ordered by (updated, id)
+
+        Batches are fetched using a keyset cursor on (updated, id) so
+        no OFFSET is ever used and only one batch is held in memory
+        at a time.
+
+        Arguments:
+
+        timestamp, version, deleted, strict: see `since`
+
+        batch_size <int=1000> number of objects to fetch per query
+
+        cursor <tuple=None> (updated, id) of the last object received, if
+        specified continue streaming after that object. Use `since_cursor`
+        to get the cursor for an object
+
+        Yields:
+
+        model instances
+        """
+
+        qset = self.since(
+            timestamp=timestamp, version=version, deleted=deleted, strict=strict
+        )
+        qset = qset.order_by("updated", "id")
+
+        while True:
+            batch = list(self._since_page(qset, cursor, batch_size))
+
+            yield from batch
+
+            if len(batch) < batch_size:
+                return
+
+            cursor = self.since_cursor(batch[-1])
+
+    async def asince_iter(
+        self,
+        timestamp=None,
+        version=None,
+        deleted=False,
+        strict=None,
+        batch_size=1000,
+        cursor=None,
+    ):
+        """
+        Async version of `since_iter`, use with `async for`
+
+        Batches are fetched with django's async queryset iteration where
+        available (django >= 4.1), otherwise in a worker thread
+        """
+
+        qset = self.since(
+            timestamp=timestamp, version=version, deleted=deleted, strict=strict
+        )
+        qset = qset.order_by("updated", "id")
+
+        while True:
+            batch = await async_list(self._since_page(qset, cursor, batch_size))
+
+            for instance in batch:
+                yield instance
+
+            if len(batch) < batch_size:
+                return
+
+            cursor = self.since_cursor(batch[-1])
+
+    def _since_page(self, qset, cursor, batch_size):
+        """
+        Returns the page of qset following the (updated, id) keyset cursor
+        """
+
+        if cursor is not None:
+            updated, pk = cursor
+            qset = qset.filter(
+                models.Q(updated__gt=updated) | models.Q(updated=updated, id__gt=pk)
+            )
+        return qset[:batch_size]
+
+    async def asince(self, **kwargs):
+        """
+        Async version of `since`, returns the list of objects
+
+        Takes the same arguments as `since`. `since` itself does not
+        query the database, its result can also be iterated with
+        `async for` on django >= 4.1
+        """
+
+        return await async_list(self.since(**kwargs))
+
+    def since_cursor(self, instance):
+        """
+        Returns the (updated, id) keyset cursor for an object, can be
+        passed to `since_iter` to continue streaming after it
+        """
+
+        return (instance.updated, instance.id)
+
+    def as_of(self, timestamp, cascade=False, chunk_size=1000):
+        """
+        Rebuilds the objects in the queryset as they were at the specified
+        time from their django-reversion versions
+
+        Objects that have no version at or before timestamp are skipped.
+
+        Arguments:
+
+        timestamp <DateTime|int> point in time, if integer is submitted it is
+        treated like a unix timestamp
+
+        cascade <bool=False> if true also rebuild the objects of the
+        `delete_cascade` relations, level by level. Objects are matched to
+        their parents by the foreign key as it was at timestamp
+
+        chunk_size <int=1000> number of versions to fetch per database
+        round trip
+
+        Yields:
+
+        unsaved model instances
+        """
+
+        if isinstance(timestamp, numbers.Real):
+            timestamp = datetime.datetime.fromtimestamp(timestamp)
+
+        # (model, queryset, parent field attname, rebuilt parent pks)
+        level = [(self.model, self.order_by(), None, None)]
+
+        while level:
+            next_level = []
+            for model, qset, attname, parent_pks in level:
+                pks = set()
+                for instance in self._as_of(model, qset, timestamp, chunk_size):
+                    # children are matched to their parents by the foreign
+                    # key as it was at timestamp
+                    if attname and getattr(instance, attname) not in parent_pks:
+                        continue
+                    pks.add(instance.pk)
+                    yield instance
+
+                if not cascade or not pks:
+                    continue
+
+                for related, lookup in cascade_relations(model):
+                    next_level.append(
+                        self._as_of_children(related, lookup, pks, timestamp)
+                    )
+            level = next_level
+
+    def _as_of_children(self, related, lookup, pks, timestamp):
+        """
+        Returns the `as_of` level entry for the objects of a `delete_cascade`
+        relation of the rebuilt objects with the specified pks
+        """
+
+        qset = related._base_manager.using(self.db)
+
+        try:
+            field = related._meta.get_field(lookup[: -len("__in")])
+        except FieldDoesNotExist:
+            field = None
+
+        if not field or not (field.concrete and field.many_to_one):
+            return (related, qset.filter(**{lookup: pks}), None, None)
+
+        # objects that were moved to a different parent after timestamp
+        # have a version after timestamp, so current children plus the
+        # objects versioned after timestamp cover all children at timestamp
+
+        import reversion.models
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type = ContentType.objects.db_manager(self.db).get_for_model(related)
+
+        # reversion stores object ids as strings
+
+        changed = (
+            reversion.models.Version.objects.using(self.db)
+            .filter(content_type=content_type, revision__date_created__gt=timestamp)
+            .annotate(_pk=Cast("object_id", output_field=related._meta.pk))
+            .values("_pk")
+        )
+
+        qset = qset.filter(models.Q(**{lookup: pks}) | models.Q(pk__in=changed))
+        return (related, qset, field.attname, pks)
+
+    def _as_of(self, model, qset, timestamp, chunk_size):
+        """
+        Yields the objects of a queryset rebuilt from their latest version
+        at or before timestamp, using one query
+        """
+
+        # soft import, django-reversion is not a hard requirement
+        # for django-handleref
+        import reversion.models
+        from django.contrib.contenttypes.models import ContentType
+
+        content_type = ContentType.objects.db_manager(self.db).get_for_model(model)
+
+        # reversion stores object ids as strings
+
+        object_ids = qset.annotate(
+            _object_id=Cast("pk", output_field=models.CharField())
+        ).values("_object_id")
+
+        latest = (
+            reversion.models.Version.objects.using(self.db)
+            .filter(
+                content_type=content_type,
+                object_id__in=object_ids,
+                revision__date_created__lte=timestamp,
+            )
+            .order_by()
+            .values("object_id")
+            .annotate(latest_id=models.Max("id"))
+            .values("latest_id")
+        )
+
+        versions = reversion.models.Version.objects.using(self.db).filter(id__in=latest)
+
+        for version in versions.order_by("id").iterator(chunk_size=chunk_size):
+            yield next(
+                serializers.deserialize(
+                    version.format, version.serialized_data, ignorenonexistent=True
+                )
+            ).object
+
     def undeleted(self):
         """
         Only return objects that are not soft-deleted
@@ -69,6 +490,119 @@ class HandleRefQuerySet(models.QuerySet):
 
         return self.exclude(status="deleted")
 
+    def soft_delete(self, cascade=True, batch_size=1000):
+        """
+        Soft-delete all objects in the queryset using set-based
+        UPDATE queries
+
+        Objects that are already soft-deleted are skipped. The
+        `updated` field is set and `version` is incremented on
+        every object that is changed.
+
+        Arguments:
+
+        cascade <bool=True> if true also soft-delete the objects in the
+        `delete_cascade` tree, level by level
+
+        batch_size <int=1000> maximum number of primary keys passed to
+        a single query
+
+        Returns:
+
+        tuple(int, dict) total number of soft-deleted objects and a dict
+        mapping model labels to the number of soft-deleted objects
+        """
+
+        return self._update_status(
+            "deleted", ~models.Q(status="deleted"), cascade, batch_size
+        )
+
+    def undelete(self, status="ok", cascade=False, batch_size=1000):
+        """
+        Undelete all soft-deleted objects in the queryset using set-based
+        UPDATE queries
+
+        The `updated` field is set and `version` is incremented on
+        every object that is changed.
+
+        Arguments:
+
+        status <str="ok"> status to set on the undeleted objects
+
+        cascade <bool=False> if true also undelete the soft-deleted objects
+        in the `delete_cascade` tree, level by level
+
+        batch_size <int=1000> maximum number of primary keys passed to
+        a single query
+
+        Returns:
+
+        tuple(int, dict) total number of undeleted objects and a dict
+        mapping model labels to the number of undeleted objects
+        """
+
+        return self._update_status(
+            status, models.Q(status="deleted"), cascade, batch_size
+        )
+
+    def _update_status(self, status, condition, cascade, batch_size):
+        """
+        Set `status` on all objects in the queryset matching `condition`
+        and, if `cascade` is true, on the matching objects in their
+        `delete_cascade` tree
+
+        Primary keys are passed to the UPDATE and to the next level's
+        queries in batches of at most `batch_size`, so large trees stay
+        within the query parameter limits of the database backend.
+        """
+
+        now = timezone.now()
+        counts = {}
+        ops = connections[self.db].ops
+
+        with transaction.atomic(using=self.db):
+            level = [(self.model, [self.order_by()])]
+            while level:
+                next_level = []
+                for model, qsets in level:
+                    pks = [
+                        pk
+                        for qset in qsets
+                        for pk in qset.filter(condition).values_list("pk", flat=True)
+                    ]
+                    if not pks:
+                        continue
+
+                    size = min(batch_size, ops.bulk_batch_size([model._meta.pk], pks))
+                    size = max(size, 1)
+                    batches = [
+                        pks[index : index + size] for index in range(0, len(pks), size)
+                    ]
+
+                    for batch in batches:
+                        model._base_manager.using(self.db).filter(pk__in=batch).update(
+                            status=status,
+                            updated=now,
+                            version=models.F("version") + 1,
+                        )
+
+                    label = model._meta.label
+                    counts[label] = counts.get(label, 0) + len(pks)
+                    invalidate_last_change(model, using=self.db)
+
+                    if not cascade:
+                        continue
+
+                    for related, lookup in cascade_relations(model):
+                        manager = related._base_manager.using(self.db)
+                        children = [
+                            manager.filter(**{lookup: batch}) for batch in batches
+                        ]
+                        next_level.append((related, children))
+                level = next_level
+
+        return sum(counts.values()), counts
+
 
 class HandleRefManager(models.Manager):
 
@@ -92,10 +626,74 @@ class HandleRefManager(models.Manager):
         return HandleRefQuerySet(self.model, using=self._db)
 
     def last_change(self, **kwargs):
-        return self.get_queryset().last_change(**kwargs)
+        """
+        Returns the most recent time an object was either created or
+        updated
+
+        If the `last_change_cache` HandleRef option is set the value
+        will be served from the cache when possible
+
+        A value filled from the database is only cached for
+        `last_change_cache_timeout` seconds, since a commit between the
+        query and filling the cache finds the cache cold and leaves
+        the old value in place.
+        """
+
+        cache = last_change_cache(self.model)
+        if cache is None:
+            return self.get_queryset().last_change(**kwargs)
+
+        key = last_change_cache_key(self.model)
+        value = cache.get(key, _cache_miss)
+        if value is _cache_miss:
+            value = self.get_queryset().last_change(**kwargs)
+            cache.add(key, value, self.model._handleref.last_change_cache_timeout)
+        return value
+
+    async def alast_change(self):
+        """
+        Async version of `last_change`
+        """
+
+        cache = last_change_cache(self.model)
+        if cache is None:
+            return await self.get_queryset().alast_change()
+
+        if hasattr(cache, "aget"):
+            cache_get, cache_add = cache.aget, cache.aadd
+        else:
+            cache_get, cache_add = sync_to_async(cache.get), sync_to_async(cache.add)
+
+        key = last_change_cache_key(self.model)
+        value = await cache_get(key, _cache_miss)
+        if value is _cache_miss:
+            value = await self.get_queryset().alast_change()
+            await cache_add(key, value, self.model._handleref.last_change_cache_timeout)
+        return value
 
     def since(self, **kwargs):
         return self.get_queryset().since(**kwargs)
 
+    async def asince(self, **kwargs):
+        return await self.get_queryset().asince(**kwargs)
+
+    def since_iter(self, **kwargs):
+        return self.get_queryset().since_iter(**kwargs)
+
+    def asince_iter(self, **kwargs):
+        return self.get_queryset().asince_iter(**kwargs)
+
+    def since_cursor(self, instance):
+        return self.get_queryset().since_cursor(instance)
+
     def undeleted(self):
         return self.get_queryset().undeleted()
+
+    def as_of(self, timestamp, **kwargs):
+        return self.get_queryset().as_of(timestamp, **kwargs)
+
+    def soft_delete(self, **kwargs):
+        return self.get_queryset().soft_delete(**kwargs)
+
+    def undelete(self, **kwargs):
+        return self.get_queryset().undelete(**kwargs)
@@ -1,17 +1,45 @@
-from django.db import models
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from django_handleref.manager import HandleRefManager
+from django_handleref.manager import (
+    HandleRefManager,
+    HandleRefQuerySet,
+    advance_last_change,
+    cascade_relations,
+    invalidate_last_change,
+)
 
 try:
     import reversion.signals
 
     def handle_version(**kwargs):
+        # collect the primary keys of all versioned HandleRef objects
+        # in the revision, grouped by model and database
+
+        pks = {}
         for vs in kwargs.get("versions"):
-            if isinstance(vs.object, HandleRefModel):
-                instance = vs.object
-                instance.version = instance.version + 1
-                instance.save()
+            model = vs._model
+            if not model or not issubclass(model, HandleRefModel):
+                continue
+            pk = model._meta.pk.to_python(vs.object_id)
+            pks.setdefault((model, vs.db), set()).add(pk)
+
+        # bump version (and updated, same as a save would) with one
+        # UPDATE per model
+        #
+        # instances held by the caller are not updated, they need to
+        # be refreshed (`refresh_from_db()`) to see the new values
+
+        now = timezone.now()
+        for (model, db), _pks in pks.items():
+            model._base_manager.using(db).filter(pk__in=_pks).update(
+                version=models.F("version") + 1, updated=now
+            )
+            invalidate_last_change(model, using=db)
 
     reversion.signals.post_revision_commit.connect(handle_version)
 except ImportError:
@@ -45,17 +73,179 @@ class UpdatedDateTimeField(models.DateTimeField):
 
 
 class HandleRefOptions:
-    delete_cascade = []
+    """
+    HandleRef options of a model, built from the `HandleRef` inner
+    class of the model
+
+    Known options are validated, unknown options are kept in `extra`
+    and can still be accessed as attributes. Options are read-only
+    once the model class is created.
+    """
+
+    # known options and their defaults
+    defaults = {
+        "tag": None,
+        "delete_cascade": (),
+        "bulk_delete": False,
+        "last_change_cache": None,
+        "last_change_cache_timeout": 60,
+        "since_indexes": False,
+        "since_strict": False,
+    }
+
+    __slots__ = tuple(defaults.keys()) + ("extra",)
 
     def __init__(self, cls, opts):
+        values = dict(self.defaults)
+        extra = {}
+
         if opts:
-            for key, value in opts.__dict__.items():
+            for key, value in vars(opts).items():
                 if key.startswith("__"):
                     continue
-                setattr(self, key, value)
+                if key in values:
+                    values[key] = value
+                else:
+                    extra[key] = value
+
+        if not values["tag"]:
+            values["tag"] = cls.__name__.lower()
+
+        self.validate(cls, values)
+
+        values["delete_cascade"] = tuple(values["delete_cascade"])
+
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+        object.__setattr__(self, "extra", extra)
+
+    def __getattr__(self, key):
+        # only called when regular lookup fails, so known options
+        # never get here
+        try:
+            return object.__getattribute__(self, "extra")[key]
+        except KeyError:
+            raise AttributeError(f"HandleRef option '{key}' not set")
+
+    def __setattr__(self, key, value):
+        raise AttributeError("HandleRef options are read-only")
+
+    def validate(self, cls, values):
+        """
+        Validates known option values
+
+        Raises ImproperlyConfigured on invalid values
+        """
+
+        def fail(key, expected):
+            raise ImproperlyConfigured(
+                f"{cls.__module__}.{cls.__name__}: HandleRef option "
+                f"'{key}' must be {expected}, got {values[key]!r}"
+            )
+
+        if not isinstance(values["tag"], str):
+            fail("tag", "a string")
 
-        if not getattr(self, "tag", None):
-            self.tag = cls.__name__.lower()
+        if isinstance(values["delete_cascade"], str) or not all(
+            isinstance(key, str) for key in values["delete_cascade"]
+        ):
+            fail("delete_cascade", "a list of relation names")
+
+        for key in ("bulk_delete", "since_indexes", "since_strict"):
+            if not isinstance(values[key], bool):
+                fail(key, "a boolean")
+
+        if values["last_change_cache"] is not None and not isinstance(
+            values["last_change_cache"], str
+        ):
+            fail("last_change_cache", "a cache alias or None")
+
+        timeout = values["last_change_cache_timeout"]
+        is_number = isinstance(timeout, (int, float)) and not isinstance(timeout, bool)
+        if not is_number or timeout <= 0:
+            fail("last_change_cache_timeout", "a positive number of seconds")
+
+
+class HandleRefRegistry:
+    """
+    Maps HandleRef tags to the model classes using them
+
+    Filled by `HandleRefMeta` when a concrete HandleRef model
+    class is created
+    """
+
+    def __init__(self):
+        self.tags = {}
+
+    def register(self, model):
+        tag_models = self.tags.setdefault(model._handleref.tag, [])
+        # replace models that are redefined under the same label
+        tag_models[:] = [m for m in tag_models if m._meta.label != model._meta.label]
+        tag_models.append(model)
+
+    def get_models(self, tag):
+        """
+        Returns list of models using tag
+        """
+
+        return list(self.tags.get(tag, []))
+
+    def get_model(self, tag):
+        """
+        Returns the model using tag
+
+        Raises LookupError if no model uses the tag and ValueError if
+        the tag is used by multiple models
+        """
+
+        tag_models = self.tags.get(tag)
+        if not tag_models:
+            raise LookupError(f"no HandleRef model with tag '{tag}'")
+        if len(tag_models) > 1:
+            raise ValueError(
+                "tag '{}' is used by multiple models: {}".format(
+                    tag, ", ".join(model._meta.label for model in tag_models)
+                )
+            )
+        return tag_models[0]
+
+    def models(self):
+        """
+        Returns list of all registered models
+        """
+
+        return [model for tag_models in self.tags.values() for model in tag_models]
+
+    def duplicates(self):
+        """
+        Returns dict mapping tags used by multiple models to those models
+        """
+
+        return {
+            tag: list(tag_models)
+            for tag, tag_models in self.tags.items()
+            if len(tag_models) > 1
+        }
+
+
+registry = HandleRefRegistry()
+
+
+@checks.register(checks.Tags.models)
+def check_duplicate_tags(app_configs=None, **kwargs):
+    errors = []
+    for tag, tag_models in registry.duplicates().items():
+        errors.append(
+            checks.Warning(
+                f"HandleRef tag '{tag}' is used by multiple models",
+                hint="Set a unique `tag` in the HandleRef options of: {}".format(
+                    ", ".join(model._meta.label for model in tag_models)
+                ),
+                id="handleref.W001",
+            )
+        )
+    return errors
 
 
 class HandleRefMeta(models.base.ModelBase):
@@ -73,9 +263,51 @@ class HandleRefMeta(models.base.ModelBase):
             opts = getattr(new, "HandleRef", None)
 
         setattr(new, "_handleref", HandleRefOptions(new, opts))
+
+        if new._handleref.since_indexes and not (new._meta.abstract or new._meta.proxy):
+            new._meta.indexes.extend(since_indexes(new))
+            # the migration autodetector only looks at indexes
+            # declared in Meta
+            new._meta.original_attrs["indexes"] = new._meta.indexes
+
+        if not new._meta.abstract:
+            registry.register(new)
+
         return new
 
 
+def since_indexes(model):
+    """
+    Returns the indexes supporting the `since()` and `undeleted()` access
+    patterns for a model
+
+    Index names are generated the same way django generates them for
+    unnamed indexes, each index gets its own suffix so names are unique.
+    """
+
+    undeleted = ~models.Q(status="deleted")
+    indexes = [
+        # since(deleted=False) and since_iter keyset ordering
+        (["updated", "id"], undeleted, "hru"),
+        # since(deleted=True)
+        (["updated", "id"], None, "hrs"),
+        # created branch of the since() timestamp filter
+        (["created"], None, "hrc"),
+        # since(version=...)
+        (["version"], undeleted, "hrv"),
+    ]
+
+    result = []
+    for fields, condition, suffix in indexes:
+        # a name is required to pass a condition, it is replaced
+        # by the generated name below
+        index = models.Index(fields=fields, condition=condition, name=suffix)
+        index.suffix = suffix
+        index.set_name_with_model(model)
+        result.append(index)
+    return result
+
+
 class HandleRefModel(models.Model, metaclass=HandleRefMeta):
     """
     Provides timestamps for creation and change times,
@@ -102,8 +334,7 @@ class HandleRefModel(models.Model, metaclass=HandleRefMeta):
 
     @property
     def ref_tag(self):
-        if not self._handleref.tag:
-            raise ValueError("tag not set")
+        # the tag is validated when the model class is created
         return self._handleref.tag
 
     @property
@@ -119,7 +350,7 @@ class HandleRefModel(models.Model, metaclass=HandleRefMeta):
             name = self.name
         return name + "-" + self.handle
 
-    def delete(self, hard=False):
+    def delete(self, hard=False, bulk=None):
         """
         Override the vanilla delete functionality to soft-delete
         instead. Soft-delete is accomplished by setting the
@@ -129,10 +360,25 @@ class HandleRefModel(models.Model, metaclass=HandleRefMeta):
 
         hard <bool=False> if true, do a hard delete instead, effectively
         removing the object from the database
+
+        bulk <bool=None> if true, soft-delete the `delete_cascade` tree
+        level by level with one UPDATE per relation instead of calling
+        delete() on every child. Defaults to the `bulk_delete` HandleRef option
         """
 
         if hard:
             return models.Model.delete(self)
+
+        if bulk is None:
+            bulk = self._handleref.bulk_delete
+
+        if bulk:
+            with transaction.atomic(using=self._state.db):
+                self.status = "deleted"
+                self.save()
+                self.delete_cascade_bulk()
+            return
+
         self.status = "deleted"
         self.save()
         for key in self._handleref.delete_cascade:
@@ -146,3 +392,50 @@ class HandleRefModel(models.Model, metaclass=HandleRefMeta):
 
             for child in q:
                 child.delete(hard=hard)
+
+    def delete_cascade_bulk(self):
+        """
+        Soft-delete all objects in the `delete_cascade` tree of this
+        object
+
+        The tree is resolved level by level, each level is flagged
+        as deleted with a single UPDATE per relation. Objects that
+        are already soft-deleted are skipped, so their updated
+        dates are not overridden. Changed objects will have their
+        version incremented.
+
+        Note that this does not call save() or delete() on the children,
+        so no model signals are sent for them.
+
+        Returns:
+
+        tuple(int, dict) total number of soft-deleted children and a dict
+        mapping model labels to the number of soft-deleted children
+        """
+
+        total, counts = 0, {}
+        for related, lookup in cascade_relations(self.__class__):
+            qset = HandleRefQuerySet(related, using=self._state.db)
+            _total, _counts = qset.filter(**{lookup: [self.pk]}).soft_delete()
+            total += _total
+            for label, count in _counts.items():
+                counts[label] = counts.get(label, 0) + count
+        return total, counts
+
+
+def handle_last_change_save(sender, instance, using=None, **kwargs):
+    if isinstance(instance, HandleRefModel):
+        advance_last_change(
+            sender, max(instance.created, instance.updated), using=using
+        )
+
+
+def handle_last_change_delete(sender, instance, using=None, **kwargs):
+    # hard-deleting the most recently changed object moves
+    # the watermark back, so it needs to be recomputed
+    if isinstance(instance, HandleRefModel):
+        invalidate_last_change(sender, using=using)
+
+
+post_save.connect(handle_last_change_save)
+post_delete.connect(handle_last_change_delete)
@@ -1,7 +1,28 @@
+import functools
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
 from rest_framework import serializers
 
 from django_handleref.models import HandleRefModel
 
+# serializer fields whose representation of a database value
+# is the value itself
+passthrough_representations = (
+    serializers.BooleanField.to_representation,
+    serializers.CharField.to_representation,
+    serializers.FloatField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.ReadOnlyField.to_representation,
+)
+
+# serializer fields whose representation is formatted through a
+# per dump cache, timestamps of bulk created or updated rows repeat a lot
+cached_representations = (
+    serializers.DateTimeField,
+    serializers.DateField,
+    serializers.TimeField,
+)
+
 
 class HandleRefSerializer(serializers.ModelSerializer):
     version = serializers.ReadOnlyField()
@@ -10,3 +31,106 @@ class HandleRefSerializer(serializers.ModelSerializer):
     class Meta:
         model = HandleRefModel
         fields = ["created", "updated", "status"]
+
+    @classmethod
+    def dump(cls, queryset, chunk_size=2000):
+        """
+        Generator serializing a queryset straight from `.values()` rows,
+        skipping model instance creation and per object serializer
+        field introspection
+
+        Produces the same output as the serializer for the supported
+        fields: model fields (many-to-one as primary key), `handle` if
+        listed in the serializer's fields and fields with a `source`
+        pointing to them. The extractor is compiled
+        once per serializer class, ImproperlyConfigured is raised if the
+        serializer has other fields.
+
+        Arguments:
+
+        queryset <QuerySet> objects to serialize
+
+        chunk_size <int=2000> number of rows to fetch per database round trip
+
+        Yields:
+
+        dict for each object
+        """
+
+        columns, spec = compile_extractor(cls)
+
+        fields = []
+        for key, column, field, convert in spec:
+            if isinstance(field, cached_representations):
+                convert = functools.lru_cache(maxsize=1024)(convert)
+            fields.append((key, column, convert))
+
+        for row in queryset.values(*columns).iterator(chunk_size=chunk_size):
+            data = {}
+            for key, column, convert in fields:
+                value = row[column]
+                if value is None or convert is None:
+                    data[key] = value
+                else:
+                    data[key] = convert(value)
+            yield data
+
+
+@functools.lru_cache(maxsize=None)
+def compile_extractor(serializer_class):
+    """
+    Compiles the fields of a HandleRefSerializer class into a flat
+    extractor for `.values()` rows, cached per serializer class
+
+    Returns tuple (columns, spec) where columns are the columns to
+    load and spec is a list of (key, column, serializer field, convert)
+    tuples, convert is None if the value can be used as is
+    """
+
+    model = serializer_class.Meta.model
+    pk = model._meta.pk.attname
+    columns = []
+    spec = []
+    unsupported = []
+
+    for key, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+
+        if field.source == "handle":
+            prefix = model._handleref.tag
+            columns.append(pk)
+            spec.append((key, pk, field, lambda value: prefix + str(value)))
+            continue
+
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            unsupported.append(key)
+            continue
+
+        if not model_field.concrete or model_field.many_to_many:
+            unsupported.append(key)
+            continue
+
+        if model_field.is_relation:
+            if not isinstance(field, serializers.PrimaryKeyRelatedField):
+                unsupported.append(key)
+                continue
+            convert = field.pk_field.to_representation if field.pk_field else None
+        elif type(field).to_representation in passthrough_representations:
+            convert = None
+        else:
+            convert = field.to_representation
+
+        columns.append(model_field.attname)
+        spec.append((key, model_field.attname, field, convert))
+
+    if unsupported:
+        raise ImproperlyConfigured(
+            "{}: fields not supported by dump(): {}".format(
+                serializer_class.__name__, ", ".join(unsupported)
+            )
+        )
+
+    return (list(dict.fromkeys(columns)), spec)
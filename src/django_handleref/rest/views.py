@@ -0,0 +1,207 @@
+import base64
+import binascii
+import itertools
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions, viewsets
+from rest_framework.utils.encoders import JSONEncoder
+
+from django_handleref.conditional import (
+    collection_state,
+    conditional_response,
+    object_state,
+    set_conditional_headers,
+)
+
+
+def encode_cursor(cursor):
+    """
+    Encodes an (updated, id) keyset cursor into an opaque string
+    """
+
+    updated, pk = cursor
+    value = f"{updated.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(value):
+    """
+    Decodes a string created by `encode_cursor` back into an
+    (updated, id) keyset cursor
+
+    Raises ValueError if the string is not a valid cursor
+    """
+
+    try:
+        value = base64.urlsafe_b64decode(value.encode("ascii")).decode("utf-8")
+        updated, pk = value.split("|")
+        updated = parse_datetime(updated)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("invalid cursor")
+
+    if updated is None:
+        raise ValueError("invalid cursor")
+
+    return (updated, pk)
+
+
+class ChangeFeedMixin:
+    """
+    Serves a change feed of a HandleRef model
+
+    Objects are streamed ordered by (updated, id) as a JSON document:
+
+        {"results": [...], "watermark": "..."}
+
+    Soft-deleted objects are included as tombstones containing only
+    `id` and `status`.
+
+    Pass the returned watermark as the `cursor` query parameter on the next
+    poll to receive only what changed since. Alternatively the first poll
+    can be limited with the `since` query parameter (unix timestamp).
+
+    The queryset of the view needs to be a `HandleRefQuerySet`.
+    """
+
+    # number of objects fetched and serialized per database round trip
+    feed_batch_size = 1000
+
+    def get_feed_params(self, request):
+        """
+        Returns keyword arguments for `since_iter` from the request
+        query parameters
+        """
+
+        params = {"timestamp": None, "cursor": None}
+
+        since = request.query_params.get("since")
+        cursor = request.query_params.get("cursor")
+
+        if since:
+            try:
+                params["timestamp"] = float(since)
+            except ValueError:
+                raise exceptions.ValidationError({"since": "Invalid timestamp"})
+
+        if cursor:
+            try:
+                params["cursor"] = decode_cursor(cursor)
+            except ValueError:
+                raise exceptions.ValidationError({"cursor": "Invalid cursor"})
+
+        return params
+
+    def get_tombstone(self, instance):
+        return {"id": instance.id, "status": instance.status}
+
+    def feed(self, request, *args, **kwargs):
+        params = self.get_feed_params(request)
+        qset = self.filter_queryset(self.get_queryset())
+
+        objects = qset.since_iter(
+            timestamp=params["timestamp"],
+            deleted=True,
+            batch_size=self.feed_batch_size,
+            cursor=params["cursor"],
+        )
+
+        return StreamingHttpResponse(
+            self.stream_feed(objects, params["cursor"]),
+            content_type="application/json",
+        )
+
+    def stream_feed(self, objects, cursor):
+        """
+        Generator yielding the feed JSON document in chunks, one chunk
+        per batch of objects
+        """
+
+        encoder = JSONEncoder()
+        separator = ""
+
+        yield '{"results": ['
+
+        while True:
+            batch = list(itertools.islice(objects, self.feed_batch_size))
+            if not batch:
+                break
+
+            live = [instance for instance in batch if instance.status != "deleted"]
+            data = iter(self.get_serializer(live, many=True).data)
+
+            rows = []
+            for instance in batch:
+                if instance.status == "deleted":
+                    rows.append(self.get_tombstone(instance))
+                else:
+                    rows.append(next(data))
+
+            yield separator + ", ".join(encoder.encode(row) for row in rows)
+            separator = ", "
+
+            cursor = (batch[-1].updated, batch[-1].id)
+
+        watermark = encode_cursor(cursor) if cursor else None
+        yield '], "watermark": ' + json.dumps(watermark) + "}"
+
+
+class ChangeFeedViewSet(ChangeFeedMixin, viewsets.GenericViewSet):
+    """
+    Read only viewset serving the change feed of a HandleRef model as its
+    `list` action
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.feed(request, *args, **kwargs)
+
+
+class ConditionalListMixin:
+    """
+    Answers conditional GET requests to the `list` action with 304
+    (Not Modified) before the queryset is serialized
+
+    ETag and Last-Modified are computed from the filtered queryset with
+    a single aggregate query. Needs to come before the mixin providing
+    `list` in the view's bases.
+    """
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = collection_state(
+            self.filter_queryset(self.get_queryset())
+        )
+
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+
+        set_conditional_headers(request, response, etag, last_modified)
+        return response
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answers conditional GET requests to the `retrieve` action with 304
+    (Not Modified) before the object is serialized
+
+    ETag and Last-Modified are computed from the `version` and `updated`
+    fields of the object. Needs to come before the mixin providing
+    `retrieve` in the view's bases.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        etag, last_modified = object_state(
+            self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        )
+
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+
+        set_conditional_headers(request, response, etag, last_modified)
+        return response
@@ -0,0 +1,286 @@
+import base64
+import datetime
+import gzip
+import itertools
+import json
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections, models, transaction
+
+from django_handleref.manager import invalidate_last_change
+
+FORMAT = "handleref-snapshot"
+FORMAT_VERSION = 1
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder keeping the full precision of datetime and time
+    values and encoding binary values as base64
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, (bytes, memoryview)):
+            return base64.b64encode(bytes(o)).decode("ascii")
+        return super().default(o)
+
+
+def snapshot_fields(model):
+    """
+    Returns the concrete fields of a model stored in a snapshot
+    """
+
+    return list(model._meta.concrete_fields)
+
+
+def check_model(model):
+    """
+    Raises SnapshotError if the table of a model can not be stored in a
+    snapshot
+
+    Rows are inserted into a single table on load, so models using multi
+    table inheritance are not supported.
+    """
+
+    if model._meta.concrete_model._meta.parents:
+        raise SnapshotError(
+            f"{model._meta.label}: multi table inheritance is not supported"
+        )
+
+
+def dump(models_list, fileobj, batch_size=1000, using="default"):
+    """
+    Writes a snapshot of HandleRef model tables to a binary file object
+
+    The snapshot is gzip compressed JSON lines: a format line, then for
+    every table a header line with the field types and the
+    (tag, max updated, max version) watermark, followed by the rows in
+    column chunks of up to batch_size rows.
+
+    Only rows updated at or before the watermark are written, rows changed
+    while the snapshot is written are picked up by a `since()` sync
+    starting from the watermark.
+
+    Arguments:
+
+    models_list <list> HandleRef models to dump
+
+    fileobj <file> binary file object to write to
+
+    batch_size <int=1000> number of rows to fetch and write per chunk
+
+    using <str="default"> database alias
+
+    Returns:
+
+    list of table headers
+    """
+
+    for model in models_list:
+        check_model(model)
+
+    encoder = SnapshotEncoder(separators=(",", ":"))
+    headers = []
+
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as out:
+
+        def write(data):
+            out.write(encoder.encode(data).encode("utf-8"))
+            out.write(b"\n")
+
+        write({"format": FORMAT, "version": FORMAT_VERSION})
+
+        for model in models_list:
+            fields = snapshot_fields(model)
+            qset = model._base_manager.using(using)
+
+            state = qset.aggregate(
+                updated=models.Max("updated"), version=models.Max("version")
+            )
+
+            header = {
+                "model": model._meta.label,
+                "fields": [[f.attname, f.get_internal_type()] for f in fields],
+                "watermark": {
+                    "tag": model._handleref.tag,
+                    "updated": state["updated"],
+                    "version": state["version"],
+                },
+            }
+            write({"header": header})
+            headers.append(header)
+
+            if state["updated"] is None:
+                continue
+
+            rows = (
+                qset.filter(updated__lte=state["updated"])
+                .order_by("pk")
+                .values_list(*[f.attname for f in fields])
+                .iterator(chunk_size=batch_size)
+            )
+
+            while True:
+                chunk = list(itertools.islice(rows, batch_size))
+                if not chunk:
+                    break
+                write({"columns": [list(column) for column in zip(*chunk)]})
+
+    return headers
+
+
+def read(fileobj):
+    """
+    Generator reading the lines of a snapshot from a binary file object
+
+    Raises SnapshotError if the file is not a snapshot or is corrupt
+
+    Yields:
+
+    dict for each line
+    """
+
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as src:
+        try:
+            lines = (json.loads(line) for line in src)
+            info = next(lines, None)
+
+            if not info or info.get("format") != FORMAT:
+                raise SnapshotError("not a snapshot")
+            if info.get("version") != FORMAT_VERSION:
+                raise SnapshotError(
+                    f"unsupported snapshot version {info.get('version')}"
+                )
+
+            yield from lines
+        except (EOFError, OSError, ValueError) as exc:
+            if isinstance(exc, SnapshotError):
+                raise
+            raise SnapshotError(f"corrupt snapshot: {exc}")
+
+
+def insert_raw(model, objects, fields, batch_size, using):
+    """
+    Inserts objects with their field values as they are, same as
+    `loaddata` does, so `auto_now` / `auto_now_add` timestamps are kept
+
+    Uses the queryset's internal `_insert` (which `bulk_create` is built
+    on) since `bulk_create` has no raw mode, models are checked with
+    `check_model` so all fields live in the model's own table.
+    """
+
+    connection = connections[using]
+    qset = model._base_manager.using(using)
+    size = max(min(batch_size, connection.ops.bulk_batch_size(fields, objects)), 1)
+    for index in range(0, len(objects), size):
+        qset._insert(
+            objects[index : index + size], fields=fields, raw=True, using=using
+        )
+
+
+def read_header(header):
+    """
+    Returns [header, 0, model, fields] for a snapshot table header
+
+    Raises SnapshotError if the model or a field does not exist or the
+    model is not supported
+    """
+
+    try:
+        model = apps.get_model(header["model"])
+        fields = [model._meta.get_field(name) for name, _ in header["fields"]]
+    except (LookupError, FieldDoesNotExist, TypeError, ValueError) as exc:
+        raise SnapshotError(f"invalid header: {exc}")
+
+    check_model(model)
+    return [header, 0, model, fields]
+
+
+def load(fileobj, batch_size=1000, using="default"):
+    """
+    Loads a snapshot written by `dump` from a binary file object, rows
+    are inserted raw (keeping the stored timestamps) one batch at a time
+
+    The tables are expected to not hold the snapshot's rows yet,
+    SnapshotError is raised (and nothing is loaded) if a row can not be
+    inserted.
+
+    Arguments:
+
+    fileobj <file> binary file object to read from
+
+    batch_size <int=1000> number of rows to insert per query
+
+    using <str="default"> database alias
+
+    Returns:
+
+    list of (table header, number of rows loaded)
+    """
+
+    connection = connections[using]
+    result = []
+
+    try:
+        with transaction.atomic(using=using):
+            with connection.constraint_checks_disabled():
+                for line in read(fileobj):
+                    if not isinstance(line, dict):
+                        raise SnapshotError("corrupt snapshot: unknown line")
+
+                    if "header" in line:
+                        result.append(read_header(line["header"]))
+                        continue
+
+                    if "columns" not in line:
+                        raise SnapshotError("corrupt snapshot: unknown line")
+                    if not result:
+                        raise SnapshotError("corrupt snapshot: rows before header")
+
+                    _, _, model, fields = result[-1]
+                    objects = (
+                        model(
+                            **{
+                                field.attname: field.to_python(value)
+                                for field, value in zip(fields, row)
+                            }
+                        )
+                        for row in zip(*line["columns"])
+                    )
+
+                    while True:
+                        batch = list(itertools.islice(objects, batch_size))
+                        if not batch:
+                            break
+                        insert_raw(model, batch, fields, batch_size, using)
+                        result[-1][1] += len(batch)
+
+            loaded = {model for _, count, model, _ in result if count}
+            connection.check_constraints(
+                table_names=[model._meta.db_table for model in loaded]
+            )
+
+            if loaded:
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(no_style(), loaded):
+                        cursor.execute(sql)
+    except SnapshotError:
+        raise
+    except ValidationError as exc:
+        raise SnapshotError(f"invalid value: {'; '.join(exc.messages)}")
+    except (DatabaseError, TypeError, ValueError) as exc:
+        raise SnapshotError(f"unable to load rows: {exc}")
+
+    for _, _, model, _ in result:
+        invalidate_last_change(model, using=using)
+
+    return [(header, count) for header, count, _, _ in result]
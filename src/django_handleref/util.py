@@ -1,11 +1,84 @@
 import re
 
+re_tag = re.compile(r"^(?P<tag>[a-zA-Z]+)[\s-]*(?P<pk>\d+)$")
+
 
 def split_ref(string):
     """splits a string into (tag, id)"""
-    re_tag = re.compile(r"^(?P<tag>[a-zA-Z]+)[\s-]*(?P<pk>\d+)$")
     m = re_tag.search(string)
     if not m:
         raise ValueError(f"unable to split string '{string}'")
 
     return (m.group("tag").lower(), int(m.group("pk")))
+
+
+def tag_registry(models=None):
+    """
+    Returns a dict mapping HandleRef tags to lists of models using the tag
+
+    Arguments:
+
+    models <list=None> HandleRef models to include, defaults to all
+    HandleRef models
+    """
+
+    if models is None:
+        from django_handleref.models import registry
+
+        return registry.tags
+
+    tags = {}
+    for model in models:
+        tags.setdefault(model._handleref.tag, []).append(model)
+    return tags
+
+
+def resolve_handles(handles, models=None):
+    """
+    Resolves handles (e.g. "org1") to model instances, loading each
+    model with one query
+
+    Arguments:
+
+    handles <list> handles to resolve
+
+    models <list=None> HandleRef models to resolve handles against, defaults
+    to all HandleRef models
+
+    Returns dict mapping each handle to its instance, handles that are invalid,
+    have an unknown tag or point to a missing object are mapped to None
+
+    Raises ValueError if a tag is used by more than one of the models
+    """
+
+    registry = tag_registry(models)
+
+    result = {}
+    tags = {}
+
+    for handle in handles:
+        result[handle] = None
+        try:
+            tag, pk = split_ref(handle)
+        except ValueError:
+            continue
+        tags.setdefault(tag, {}).setdefault(pk, []).append(handle)
+
+    for tag, pks in tags.items():
+        candidates = registry.get(tag, [])
+        if not candidates:
+            continue
+        if len(candidates) > 1:
+            raise ValueError(
+                "tag '{}' is used by multiple models: {}".format(
+                    tag, ", ".join(model._meta.label for model in candidates)
+                )
+            )
+
+        instances = candidates[0]._default_manager.in_bulk(list(pks.keys()))
+
+        for pk, _handles in pks.items():
+            for handle in _handles:
+                result[handle] = instances.get(pk)
+
+    return result
@@ -1,4 +1,14 @@
+import functools
+import json
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
 from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
+from django.utils import timezone
+
+from django_handleref.manager import invalidate_last_change
 
 try:
     import reversion
@@ -6,6 +16,39 @@ except ImportError:
     reversion = None
 
 
+class VersionDataCache:
+
+    """
+    Bounded LRU cache for decoded version data keyed by version id
+
+    Shared across requests, so cached dicts should be treated
+    as read-only
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, version_id):
+        with self.lock:
+            data = self.entries.get(version_id)
+            if data is not None:
+                self.entries.move_to_end(version_id)
+            return data
+
+    def set(self, version_id, data):
+        with self.lock:
+            self.entries[version_id] = data
+            self.entries.move_to_end(version_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
 class Version:
 
     """
@@ -72,6 +115,26 @@ class Version:
         """
         raise NotImplementedError()
 
+    def data_fields(self, fields):
+        """
+        Return object data limited to the specified fields
+
+        Override to avoid decoding the full snapshot when only
+        a few fields are needed.
+
+        Argument(s):
+
+            - fields(list): field names
+
+        Returns:
+
+            - dict
+
+        """
+
+        data = self.data
+        return {field: data[field] for field in fields if field in data}
+
     @property
     def model(self):
         """
@@ -150,8 +213,44 @@ class Version:
 
         """
 
+        stored = self.stored_changes(previous)
+        if stored is not None:
+            return stored
+
         return Diff(previous, self).changes
 
+    @classmethod
+    def prefetch_changes(cls, versions):
+        """
+        Load persisted changes for multiple Version objects
+        in batch - override if the versioning solution supports
+        persisted changes
+
+        Argument(s):
+
+            - versions(list): list of Version instances
+
+        """
+        pass
+
+    def stored_changes(self, previous):
+        """
+        Return persisted changes for this version and a previous
+        version - override if the versioning solution supports
+        persisted changes
+
+        Argument(s):
+
+            - previous(Version)
+
+        Returns:
+
+            - dict: see `Diff.changes`
+            - None: if no changes are persisted for the two versions
+
+        """
+        return None
+
     def changed_fields(self, previous):
         """
         Return a list of changed fields between
@@ -179,6 +278,11 @@ class ReversionVersion(Version):
     Version abtraction for django-reversion
     """
 
+    # shared `VersionDataCache` for decoded version data, disabled
+    # by default
+
+    data_cache = None
+
     def __init__(self, version):
         """
         Argument(s):
@@ -240,8 +344,116 @@ class ReversionVersion(Version):
 
             - dict: object data
 
+        The decoded data is memoized on the instance and, if `data_cache`
+        is set, in the shared cache.
         """
-        return self.version.field_dict
+
+        if getattr(self, "_data", None) is not None:
+            return self._data
+
+        data = self.cached_data()
+        if data is None:
+            data = self.version.field_dict
+            if self.data_cache is not None:
+                self.data_cache.set(self.id, data)
+
+        self._data = data
+        return data
+
+    def cached_data(self):
+        """
+        Returns:
+
+            - dict: object data from the shared `data_cache`
+            - None: if caching is disabled or the data is not cached
+
+        """
+
+        if self.data_cache is None:
+            return None
+        return self.data_cache.get(self.id)
+
+    def data_fields(self, fields):
+        """
+        Return object data limited to the specified fields
+
+        If the full data has not been decoded yet, only the specified
+        fields are decoded from the serialized snapshot.
+
+        Argument(s):
+
+            - fields(list): field names
+
+        Returns:
+
+            - dict
+
+        """
+
+        data = getattr(self, "_data", None)
+        if data is None:
+            data = self.cached_data()
+            self._data = data
+
+        if data is None:
+            data = self.decode_fields(fields)
+
+        if data is None:
+            data = self.data
+
+        return {field: data[field] for field in fields if field in data}
+
+    def decode_fields(self, fields):
+        """
+        Decode the specified fields from the serialized snapshot
+
+        Argument(s):
+
+            - fields(list): field names
+
+        Returns:
+
+            - dict: decoded field values
+            - None: if the snapshot cannot be partially decoded, in which
+                case the full data should be used
+
+        """
+
+        model = self.model
+
+        if self.version.format != "json" or model._meta.parents:
+            return None
+
+        if getattr(self, "_raw", None) is None:
+            self._raw = json.loads(self.version.serialized_data)[0]
+
+        model_fields = {field.attname: field for field in model._meta.concrete_fields}
+        data = {}
+
+        for name in fields:
+            field = model_fields.get(name)
+            if field is None:
+                continue
+
+            if field.primary_key:
+                value = self._raw.get("pk")
+            elif field.name in self._raw["fields"]:
+                value = self._raw["fields"][field.name]
+            else:
+                continue
+
+            if field.is_relation:
+                # natural keys need to go through the deserializer
+                if isinstance(value, list):
+                    return None
+                if value is not None:
+                    value = field.target_field.to_python(value)
+            else:
+                value = field.to_python(value)
+
+            data[name] = value
+
+        return data
 
     @property
     def model(self):
@@ -270,6 +482,89 @@ class ReversionVersion(Version):
 
         return sorted(data, key=lambda i: i[0])
 
+    @classmethod
+    def changes_summary(cls, versions):
+        """
+        Compiles and return a changes summary of multiple
+        Version objects, see `Version.changes_summary`
+
+        Previous versions are loaded in batch through
+        `ReversionVersionChain`
+        """
+
+        ReversionVersionChain.link(versions)
+        cls.prefetch_changes(versions)
+        return super().changes_summary(versions)
+
+    @classmethod
+    def prefetch_changes(cls, versions):
+        """
+        Load persisted changes for multiple Version objects with
+        one query if the `django_handleref.versiondiff` app is installed
+
+        Argument(s):
+
+            - versions(list): list of ReversionVersion instances
+
+        """
+
+        if not apps.is_installed("django_handleref.versiondiff"):
+            return
+
+        VersionDiff = apps.get_model("handleref_versiondiff", "VersionDiff")
+
+        versions = [version for version in versions if version.version]
+        diffs = VersionDiff.objects.filter(
+            version_id__in=[version.id for version in versions]
+        )
+        diffs = {diff.version_id: diff for diff in diffs}
+
+        for version in versions:
+            version._stored_diff = diffs.get(version.id)
+
+    def changes(self, previous):
+        """
+        Return a `Diff` instance for this version
+        and a previous version, using persisted changes
+        if available
+
+        Argument(s):
+
+            - previous(Version)
+
+        Returns(s):
+
+            - Diff
+
+        """
+
+        if not hasattr(self, "_stored_diff") and self.version:
+            self.prefetch_changes([self])
+        return super().changes(previous)
+
+    def stored_changes(self, previous):
+        """
+        Return persisted changes for this version and a previous
+        version, only available after `prefetch_changes`
+
+        Argument(s):
+
+            - previous(Version)
+
+        Returns:
+
+            - dict: see `Diff.changes`
+            - None: if no changes are persisted for the two versions
+
+        """
+
+        diff = getattr(self, "_stored_diff", None)
+        if diff is None or not previous or not previous.version:
+            return None
+        if diff.previous_version_id != previous.id:
+            return None
+        return diff.changes
+
     @property
     def previous(self):
         """
@@ -283,16 +578,18 @@ class ReversionVersion(Version):
         if hasattr(self, "_previous"):
             return self._previous
 
-        versions = reversion.models.Version.objects.get_for_object(
-            self.version.object
-        ).order_by("-id")
-
-        for version in versions:
-            if version.id < self.version.id:
-                self._previous = self.__class__(version)
-                return self._previous
+        qset = reversion.models.Version.objects.filter(
+            content_type_id=self.version.content_type_id,
+            object_id=self.version.object_id,
+            id__lt=self.version.id,
+        )
+        version = qset.order_by("-id").first()
 
-        return None
+        if version is None:
+            self._previous = None
+        else:
+            self._previous = self.__class__(version)
+        return self._previous
 
     @property
     def next(self):
@@ -316,6 +613,202 @@ class ReversionVersion(Version):
         return self._next
 
 
+class VersionChain:
+
+    """
+    Ordered chain of versions of a single object with previous / next
+    neighbours linked in memory - extend to support different
+    types of django object versioning solutions
+    """
+
+    version_cls = Version
+
+    def __init__(self, versions, first=False, last=False):
+        """
+        Argument(s):
+
+            - versions(list): version objects or `Version` instances,
+                ordered oldest first
+
+        Keyword Argument(s):
+
+            - first(bool): chain starts at the first version of the
+                object, so the first version has no previous version
+            - last(bool): chain ends at the latest version of the object,
+                so the last version has no next version
+
+        """
+
+        self.versions = [self.wrap(version) for version in versions]
+        self.index = {version.id: version for version in self.versions}
+
+        for previous, version in zip(self.versions, self.versions[1:]):
+            version._previous = previous
+            previous._next = version
+
+        if self.versions and first:
+            self.versions[0]._previous = None
+        if self.versions and last:
+            self.versions[-1]._next = self.version_cls(None)
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    def __len__(self):
+        return len(self.versions)
+
+    def __getitem__(self, index):
+        return self.versions[index]
+
+    def wrap(self, version):
+        if isinstance(version, Version):
+            return version
+        return self.version_cls(version)
+
+    def get(self, id):
+        """
+        Returns the Version instance for a version id or None
+        if the version is not part of the chain
+        """
+        return self.index.get(id)
+
+    @classmethod
+    def for_object(cls, obj):
+        """
+        Should return a chain holding all versions of obj
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def link(cls, versions):
+        """
+        Should link the previous / next neighbours of the specified
+        Version instances
+        """
+        raise NotImplementedError()
+
+
+class ReversionVersionChain(VersionChain):
+
+    """
+    Version chain abstraction for django-reversion
+    """
+
+    version_cls = ReversionVersion
+
+    @classmethod
+    def for_object(cls, obj):
+        """
+        Load all versions of an object with one query
+
+        Argument(s):
+
+            - obj(model instance)
+
+        Returns:
+
+            - ReversionVersionChain
+
+        """
+
+        versions = reversion.models.Version.objects.get_for_object(obj)
+        return cls(versions.order_by("id"), first=True, last=True)
+
+    @classmethod
+    def link(cls, versions):
+        """
+        Link previous / next neighbours of the specified Version
+        instances in memory
+
+        Neighbours are loaded with one query per versioned object
+        covering the id range of the specified versions and the version
+        preceding them.
+
+        Argument(s):
+
+            - versions(list): list of ReversionVersion instances
+
+        """
+
+        groups = {}
+        for version in versions:
+            if not version.version:
+                continue
+            key = (version.version.content_type_id, version.version.object_id)
+            groups.setdefault(key, []).append(version)
+
+        for (content_type_id, object_id), group in groups.items():
+            ids = [version.id for version in group]
+            min_id = min(ids)
+
+            qset = reversion.models.Version.objects.filter(
+                content_type_id=content_type_id,
+                object_id=object_id,
+                id__lte=max(ids),
+            )
+
+            # walk backwards until the version preceding the
+            # oldest version has been found
+
+            rows = []
+            first = True
+            for row in qset.order_by("-id").iterator():
+                rows.append(row)
+                if row.id < min_id:
+                    first = False
+                    break
+
+            rows.reverse()
+            chain = cls(rows, first=first)
+
+            for version in group:
+                linked = chain.get(version.id)
+                version._previous = linked.previous
+                if hasattr(linked, "_next"):
+                    version._next = linked._next
+
+    @classmethod
+    def link_previous(cls, versions):
+        """
+        Set the previous neighbour of the specified Version instances
+
+        Unlike `link` this uses a fixed number of queries no matter how
+        many objects the versions belong to: one query resolving the id of
+        each previous version and one query loading them.
+
+        Argument(s):
+
+            - versions(list): list of ReversionVersion instances
+
+        """
+
+        versions = [version for version in versions if version.version]
+        if not versions:
+            return
+
+        previous = reversion.models.Version.objects.filter(
+            content_type_id=models.OuterRef("content_type_id"),
+            object_id=models.OuterRef("object_id"),
+            id__lt=models.OuterRef("id"),
+        ).order_by("-id")
+
+        previous_ids = dict(
+            reversion.models.Version.objects.filter(
+                id__in=[version.id for version in versions]
+            )
+            .annotate(previous_id=models.Subquery(previous.values("id")[:1]))
+            .values_list("id", "previous_id")
+        )
+
+        rows = reversion.models.Version.objects.in_bulk(
+            [pk for pk in previous_ids.values() if pk is not None]
+        )
+
+        for version in versions:
+            row = rows.get(previous_ids.get(version.id))
+            version._previous = cls.version_cls(row) if row else None
+
+
 class Diff:
 
     """
@@ -398,12 +891,131 @@ class Diff:
         return f"{value}"
 
 
+class HistoryDiff:
+
+    """
+    Describes changes between every pair of adjacent versions in
+    an ordered version chain, computed in one pass
+    """
+
+    diff_cls = Diff
+
+    def __init__(self, versions, previous=None):
+        """
+        Argument(s):
+
+            - versions(list): Version instances, ordered oldest first
+
+        Keyword Argument(s):
+
+            - previous(Version): version preceding the first version, if
+                any, the first version will be compared against it
+
+        """
+
+        self.versions = list(versions)
+        self.previous = previous
+
+    @property
+    def changes(self):
+        """
+        Compile and return the changes of every version compared to
+        its predecessor
+
+        Returns:
+
+            - list: one entry per version, each entry being the same
+              as `Diff.changes` for the version and its predecessor -
+              None if there is no predecessor to compare to
+
+        """
+
+        versions = [self.previous] + self.versions
+        ignore = frozenset(self.diff_cls.diff_ignore_fields)
+        formatter = self.diff_cls(None, None)
+
+        # use persisted changes where available
+
+        stored = [
+            version.stored_changes(previous)
+            for previous, version in zip(versions, versions[1:])
+        ]
+
+        # only versions that are part of a pair without persisted
+        # changes need to be decoded
+
+        needed = set()
+        for index, changes in enumerate(stored):
+            if changes is None:
+                needed.update((index, index + 1))
+
+        # decode every needed version once, None marks a version that
+        # cannot be compared
+
+        rows = [
+            version.data if index in needed and version and version.version else None
+            for index, version in enumerate(versions)
+        ]
+
+        # collect fields in order of appearance so changes are
+        # ordered the same way `Diff.changes` orders them
+
+        columns = {}
+        for row in rows:
+            if row is None:
+                continue
+            for field in row:
+                if field not in ignore and field not in columns:
+                    columns[field] = None
+
+        result = [
+            {} if row_a is not None and row_b is not None else None
+            for row_a, row_b in zip(rows, rows[1:])
+        ]
+
+        missing = object()
+
+        for field in columns:
+            values = [row.get(field, missing) if row else missing for row in rows]
+            for index, diff in enumerate(result):
+                if diff is None or stored[index] is not None:
+                    continue
+
+                value_b = values[index + 1]
+                if value_b is missing:
+                    continue
+
+                value_a = values[index]
+                if value_a is missing:
+                    value_a = None
+
+                if value_a == value_b:
+                    continue
+
+                if isinstance(value_a, str) or isinstance(value_a, int):
+                    diff[field] = {"old": value_a, "changed": value_b}
+                else:
+                    diff[field] = {
+                        "old": formatter.format_value(value_a),
+                        "changed": formatter.format_value(value_b),
+                    }
+
+        return [
+            changes if changes is not None else diff
+            for changes, diff in zip(stored, result)
+        ]
+
+
 class Reverter:
 
     """
     Allows to revert / rollback changes
     """
 
+    # fields that are never rolled back
+
+    rollback_ignore_fields = ["created", "updated", "version"]
+
     def revert_fields(self, instance, field_versions, **kwargs):
         """
         Revert a set of fields
@@ -444,14 +1056,160 @@ class Reverter:
 
         """
 
+        self.apply_rollback(instance, version)
+        instance.save()
+
+    def apply_rollback(self, instance, version, validate_status=True):
+        """
+        Set the field values of a version on an instance and validate
+        them, without saving the instance
+
+        Argument(s):
+
+            - instance(model instance): instance of django model
+              to be reverted
+            - version(Version): version to roll back to
+
+        Keyword Argument(s):
+
+            - validate_status(bool): validate the status change against
+              the status of parent objects
+
+        Raises:
+
+            - ValidationError: if any of the fields fail validation
+
+        """
+
         for field, value in version.data.items():
-            if field in ["created", "updated", "version"]:
+            if field in self.rollback_ignore_fields:
                 continue
-            if field == "status":
-                self.validate_status_change(instance, value)
             setattr(instance, field, value)
+        if validate_status and "status" in version.data:
+            self.validate_status_change(instance, instance.status)
         instance.full_clean()
-        instance.save()
+
+    def bulk_rollback(self, pairs, batch_size=500, **kwargs):
+        """
+        Rollback many objects to specific versions in one transaction
+
+        Objects are validated and written with `bulk_update` in
+        batches. Objects that fail validation are reported and
+        skipped instead of aborting the whole rollback. If a batch
+        violates a database constraint (e.g. two objects rolled back
+        to the same unique value) its objects are saved one at a time
+        and the ones that fail are reported.
+
+        All instances need to be from the same database.
+
+        Argument(s):
+
+            - pairs(list): list of (instance, version) tuples
+
+        Keyword Argument(s):
+
+            - batch_size(int): number of objects to validate and
+              write per batch
+
+        Returns:
+
+            - tuple(list, dict): list of rolled back instances and a
+              dict mapping instances that failed validation to
+              their ValidationError
+
+        """
+
+        pairs = list(pairs)
+        rolled_back = []
+        failed = {}
+        now = timezone.now()
+
+        databases = {instance._state.db or DEFAULT_DB_ALIAS for instance, _ in pairs}
+        if len(databases) > 1:
+            raise ValueError("instances need to be from the same database")
+        using = databases.pop() if databases else DEFAULT_DB_ALIAS
+
+        with transaction.atomic(using=using):
+            for offset in range(0, len(pairs), batch_size):
+                batch = {}
+                applied = []
+
+                for instance, version in pairs[offset : offset + batch_size]:
+                    try:
+                        self.apply_rollback(instance, version, validate_status=False)
+                    except ValidationError as exc:
+                        failed[instance] = exc
+                        continue
+                    applied.append((instance, version))
+
+                # validate status changes of the whole batch at once
+
+                errors = self.validate_status_changes(
+                    [
+                        (instance, instance.status)
+                        for instance, version in applied
+                        if "status" in version.data
+                    ]
+                )
+
+                for instance, version in applied:
+                    if instance in errors:
+                        failed[instance] = errors[instance]
+                        continue
+
+                    model = instance.__class__
+                    instances, fields = batch.setdefault(model, ([], set()))
+                    instances.append(instance)
+                    fields.update(self.rollback_field_names(model, version))
+
+                for model, (instances, fields) in batch.items():
+                    # bulk_update does not handle auto_now fields
+
+                    for field in model._meta.concrete_fields:
+                        if getattr(field, "auto_now", False):
+                            for instance in instances:
+                                setattr(instance, field.attname, now)
+                            fields.add(field.name)
+
+                    try:
+                        with transaction.atomic(using=using):
+                            model._base_manager.using(using).bulk_update(
+                                instances, sorted(fields)
+                            )
+                    except IntegrityError:
+                        # find the objects violating the constraint
+                        for instance in instances:
+                            try:
+                                with transaction.atomic(using=using):
+                                    instance.save(
+                                        using=using, update_fields=sorted(fields)
+                                    )
+                            except IntegrityError as exc:
+                                failed[instance] = ValidationError(str(exc))
+                            else:
+                                rolled_back.append(instance)
+                    else:
+                        rolled_back.extend(instances)
+
+                    invalidate_last_change(model, using=using)
+
+        return rolled_back, failed
+
+    def rollback_field_names(self, model, version):
+        """
+        Return the names of the model fields written by a
+        rollback to version
+        """
+
+        names = []
+        for field in version.data.keys():
+            if field in self.rollback_ignore_fields:
+                continue
+            model_field = model._meta.get_field(field)
+            if model_field.primary_key or model_field.many_to_many:
+                continue
+            names.append(model_field.name)
+        return names
 
     def validate_status_change(self, instance, status):
         """
@@ -467,17 +1225,62 @@ class Reverter:
 
         """
 
-        for field in instance.__class__._meta.get_fields():
-            if not field.is_relation or not field.many_to_one:
-                continue
-            try:
-                relation = getattr(instance, field.name)
-            except Exception:
+        errors = self.validate_status_changes([(instance, status)])
+        if instance in errors:
+            raise errors[instance]
+
+    def validate_status_changes(self, changes):
+        """
+        Validate status value changes of multiple instances, see
+        `validate_status_change`
+
+        Parent status is checked with one query per related model.
+
+        Argument(s):
+
+            - changes(list): list of (instance, status) tuples
+
+        Returns:
+
+            - dict: mapping instances that failed validation to
+              their ValidationError
+
+        """
+
+        # collect parent ids per parent model and referenced field
+        # (`to_field`), only undeleted objects need their parents checked
+
+        relations = {}
+        for instance, status in changes:
+            if status == "deleted":
                 continue
-            self.validate_parent_status(instance, relation, status)
+            for field in parent_fields(instance.__class__):
+                parent_id = getattr(instance, field.attname)
+                if parent_id is None:
+                    continue
+                key = (field.related_model, field.target_field.attname)
+                relations.setdefault(key, {}).setdefault(parent_id, []).append(
+                    (instance, status)
+                )
+
+        errors = {}
+        for (model, attname), parent_ids in relations.items():
+            parents = model._base_manager.filter(
+                **{f"{attname}__in": list(parent_ids.keys())}, status="deleted"
+            )
+            for parent in parents:
+                for instance, status in parent_ids[getattr(parent, attname)]:
+                    if instance in errors:
+                        continue
+                    try:
+                        self.validate_parent_status(instance, parent, status)
+                    except ValidationError as exc:
+                        errors[instance] = exc
+
+        return errors
 
     def validate_parent_status(self, instance, parent, status):
-        if not hasattr(parent, "HandleRef"):
+        if not hasattr(parent, "_handleref"):
             return
 
         if parent.status == "deleted" and status != "deleted":
@@ -490,6 +1293,21 @@ class Reverter:
             )
 
 
+@functools.lru_cache(maxsize=None)
+def parent_fields(model):
+    """
+    Return the many-to-one fields of a model pointing to
+    HandleRef models, cached per model class
+    """
+
+    def is_parent(field):
+        if not (field.is_relation and field.many_to_one and field.concrete):
+            return False
+        return hasattr(field.related_model, "_handleref")
+
+    return [field for field in model._meta.get_fields() if is_parent(field)]
+
+
 class ReversionReverter(Reverter):
 
     """
@@ -557,3 +1375,42 @@ class ReversionReverter(Reverter):
                 "rollback to version {}".format(version.data["version"])
             )
             super().rollback(instance, version)
+
+    def bulk_rollback(self, pairs, user=None, batch_size=500):
+        """
+        Rollback many objects to specific versions in one transaction,
+        see `Reverter.bulk_rollback`
+
+        All rolled back objects are added to a single revision, the
+        revision commit increments their `version` with one UPDATE
+        per model.
+
+        Argument(s):
+
+            - pairs(list): list of (instance, version) tuples
+
+        Keyword Argument(s):
+
+            - user(User): user that authored the revision
+            - batch_size(int): number of objects to validate and
+              write per batch
+
+        Returns:
+
+            - tuple(list, dict): list of rolled back instances and a
+              dict mapping instances that failed validation to
+              their ValidationError
+
+        """
+
+        with reversion.create_revision():
+            if user:
+                reversion.set_user(user)
+
+            rolled_back, failed = super().bulk_rollback(pairs, batch_size=batch_size)
+
+            reversion.set_comment(f"bulk rollback of {len(rolled_back)} object(s)")
+            for instance in rolled_back:
+                reversion.add_to_revision(instance)
+
+        return rolled_back, failed
@@ -0,0 +1,5 @@
+"""
+Optional app persisting the changes of each django-reversion version
+
+Add "django_handleref.versiondiff" to INSTALLED_APPS to enable it
+"""
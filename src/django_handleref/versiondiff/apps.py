@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class VersionDiffConfig(AppConfig):
+    name = "django_handleref.versiondiff"
+    label = "handleref_versiondiff"
+    verbose_name = "HandleRef Version Diffs"
+    default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        import reversion.signals
+
+        from django_handleref.versiondiff.models import handle_revision_commit
+
+        reversion.signals.post_revision_commit.connect(handle_revision_commit)
@@ -0,0 +1,38 @@
+import reversion.models
+from django.core.management.base import BaseCommand
+
+from django_handleref.version import ReversionVersion
+from django_handleref.versiondiff.models import VersionDiff
+
+
+class Command(BaseCommand):
+    help = "Store the changes of reversion versions that have none stored yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="number of versions to process per batch",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options.get("batch_size")
+
+        qset = reversion.models.Version.objects.filter(handleref_diff__isnull=True)
+        qset = qset.order_by("id")
+
+        total = 0
+        last_id = 0
+
+        while True:
+            batch = list(qset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+
+            VersionDiff.create_for_versions([ReversionVersion(v) for v in batch])
+
+            total += len(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(f"Stored changes for {total} version(s)")
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:19
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("reversion", "0001_squashed_0004_auto_20160611_1202"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionDiff",
+            fields=[
+                (
+                    "version",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="handleref_diff",
+                        serialize=False,
+                        to="reversion.version",
+                    ),
+                ),
+                (
+                    "previous_version_id",
+                    models.IntegerField(
+                        help_text="id of the version the changes were computed against",
+                        null=True,
+                        verbose_name="Previous version",
+                    ),
+                ),
+                (
+                    "changed_fields",
+                    models.JSONField(default=list, verbose_name="Changed fields"),
+                ),
+                (
+                    "changes",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                        verbose_name="Changes",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Version Diff",
+                "verbose_name_plural": "Version Diffs",
+                "db_table": "handleref_versiondiff",
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+import reversion.models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from django_handleref.version import Diff, ReversionVersion, ReversionVersionChain
+
+
+class VersionDiff(models.Model):
+
+    """
+    Persisted changes of a django-reversion version compared
+    to the previous version of the same object
+
+    Versions never change once committed so the changes only
+    need to be computed once. Values are stored as json, so values
+    that are not json types are read back as their string form.
+    """
+
+    version = models.OneToOneField(
+        reversion.models.Version,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="handleref_diff",
+    )
+    previous_version_id = models.IntegerField(
+        _("Previous version"),
+        null=True,
+        help_text=_("id of the version the changes were computed against"),
+    )
+    changed_fields = models.JSONField(_("Changed fields"), default=list)
+    changes = models.JSONField(_("Changes"), null=True, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        db_table = "handleref_versiondiff"
+        verbose_name = _("Version Diff")
+        verbose_name_plural = _("Version Diffs")
+
+    @classmethod
+    def create_for_versions(cls, versions):
+        """
+        Compute and store the changes of the specified versions
+
+        Argument(s):
+
+            - versions(list): list of ReversionVersion instances
+
+        Returns:
+
+            - list: created VersionDiff instances
+
+        """
+
+        versions = [version for version in versions if version.version]
+        ReversionVersionChain.link_previous(versions)
+
+        diffs = []
+        for version in versions:
+            previous = version.previous
+            changes = Diff(previous, version).changes
+            diffs.append(
+                cls(
+                    version_id=version.id,
+                    previous_version_id=previous.id if previous else None,
+                    changed_fields=sorted(changes.keys()) if changes else [],
+                    changes=changes,
+                )
+            )
+
+        return cls.objects.bulk_create(diffs, ignore_conflicts=True)
+
+
+def handle_revision_commit(**kwargs):
+    versions = [
+        ReversionVersion(version)
+        for version in kwargs.get("versions")
+        if version.pk is not None
+    ]
+    VersionDiff.create_for_versions(versions)
@@ -80,6 +80,7 @@ def pytest_configure():
             "django.contrib.messages",
             "django.contrib.staticfiles",
             "django_handleref",
+            "django_handleref.versiondiff",
             "reversion",
             "tests",
         ],
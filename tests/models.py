@@ -11,6 +11,7 @@ class Org(HandleRefModel):
     class HandleRef:
         tag = "org"
         delete_cascade = ["sub_entities"]
+        since_indexes = True
 
     def __unicode__(self):
         return self.name
@@ -22,6 +23,7 @@ class Sub(HandleRefModel):
 
     class HandleRef:
         tag = "sub"
+        last_change_cache = "default"
 
     def __unicode__(self):
         return self.name
@@ -32,3 +34,16 @@ class Widget(HandleRefModel):
 
     class HandleRef:
         custom_option = "passthrough"
+
+
+class Member(HandleRefModel):
+    name = models.CharField(max_length=255, unique=True)
+    org = models.ForeignKey(
+        Org, on_delete=models.CASCADE, to_field="name", related_name="members"
+    )
+
+    class HandleRef:
+        tag = "member"
+
+    def __unicode__(self):
+        return self.name
@@ -20,6 +20,20 @@ class VersionedOrg(HandleRefModel):
         return self.name
 
 
+@reversion.register
+class VersionedSub(HandleRefModel):
+    name = models.CharField(max_length=255, unique=True)
+    org = models.ForeignKey(
+        VersionedOrg, on_delete=models.CASCADE, related_name="sub_entities"
+    )
+
+    class HandleRef:
+        tag = "sub"
+
+    def __unicode__(self):
+        return self.name
+
+
 @register(VersionedOrg)
 class OrgAdmin(VersionAdmin, ModelAdmin):
     pass
@@ -0,0 +1,185 @@
+import datetime
+import gzip
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from django_handleref import snapshot
+from django_handleref.versiondiff.models import VersionDiff
+from tests.models import Org, Sub
+
+
+@pytest.mark.django_db
+def test_check_timestamps(db):
+    org = Org.objects.create(name="Timestamps")
+
+    out = io.StringIO()
+    call_command("handleref_check_timestamps", "tests.Org", stdout=out)
+    assert "tests.Org: ok" in out.getvalue()
+
+    Org.objects.filter(id=org.id).update(
+        updated=org.created - datetime.timedelta(seconds=1)
+    )
+
+    out = io.StringIO()
+    with pytest.raises(CommandError):
+        call_command("handleref_check_timestamps", stdout=out)
+    assert "tests.Org: 1 object(s)" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_backfill_versiondiff(db, reversion_org):
+    org, versions = reversion_org
+
+    VersionDiff.objects.all().delete()
+
+    out = io.StringIO()
+    call_command("handleref_backfill_versiondiff", "--batch-size", "2", stdout=out)
+    assert "Stored changes for 3 version(s)" in out.getvalue()
+
+    diff = VersionDiff.objects.get(version_id=versions[1].id)
+    assert diff.previous_version_id == versions[0].id
+    assert diff.changed_fields == ["name"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_dump_load(tmp_path):
+    org = Org.objects.create(name="Snapshot", status="ok", notes="notes")
+    for i in range(5):
+        Sub.objects.create(name=f"Snapshot {i}", org=org, status="ok")
+    Sub.objects.first().delete()
+
+    def rows():
+        return [list(model.objects.order_by("id").values()) for model in [Org, Sub]]
+
+    expected = rows()
+    path = str(tmp_path / "snapshot.gz")
+
+    out = io.StringIO()
+    call_command(
+        "handleref_dump",
+        "tests.Sub",
+        "tests.Org",
+        "-o",
+        path,
+        "--batch-size",
+        "2",
+        stdout=out,
+    )
+    assert "tests.Sub: updated" in out.getvalue()
+
+    Sub.objects.all().delete()
+    Org.objects.all().delete()
+
+    out = io.StringIO()
+    call_command("handleref_load", path, "--batch-size", "2", stdout=out)
+    assert "tests.Sub: 5 row(s)" in out.getvalue()
+    assert "tests.Org: 1 row(s)" in out.getvalue()
+
+    assert rows() == expected
+
+    # sequences are reset
+
+    sub = Sub.objects.create(name="Snapshot new", org=org, status="ok")
+    assert sub.id > expected[1][-1]["id"]
+
+
+@pytest.mark.django_db
+def test_dump_watermark():
+    Org.objects.create(name="Watermark", status="ok", version=3)
+
+    fileobj = io.BytesIO()
+    headers = snapshot.dump([Org, Sub], fileobj)
+
+    assert headers[0]["watermark"] == {
+        "tag": "org",
+        "updated": Org.objects.get().updated,
+        "version": 3,
+    }
+    assert headers[1]["watermark"]["updated"] is None
+
+    fileobj.seek(0)
+    lines = list(snapshot.read(fileobj))
+    assert [list(line.keys())[0] for line in lines] == ["header", "columns", "header"]
+
+
+@pytest.mark.django_db
+def test_load_invalid(tmp_path):
+    path = tmp_path / "invalid"
+    path.write_bytes(b"not a snapshot")
+
+    with pytest.raises(CommandError):
+        call_command("handleref_load", str(path))
+
+
+@pytest.mark.django_db
+def test_load_corrupt(tmp_path):
+    Org.objects.create(name="Corrupt", status="ok")
+
+    fileobj = io.BytesIO()
+    snapshot.dump([Org], fileobj)
+    fileobj.seek(0)
+
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as src:
+        lines = src.read().splitlines()
+
+    path = tmp_path / "corrupt"
+    with gzip.open(path, "wb") as out:
+        out.write(b"\n".join(lines[:2] + [b'{"columns": [[1'] + lines[2:]))
+
+    with pytest.raises(CommandError):
+        call_command("handleref_load", str(path))
+    assert Org.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_load_existing_rows(tmp_path):
+    Org.objects.create(name="Existing", status="ok")
+
+    path = tmp_path / "snapshot.gz"
+    call_command("handleref_dump", "tests.Org", "-o", str(path), stdout=io.StringIO())
+
+    with pytest.raises(CommandError, match="unable to load rows"):
+        call_command("handleref_load", str(path))
+    assert Org.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_load_malformed():
+    Org.objects.create(name="Malformed", status="ok")
+
+    fileobj = io.BytesIO()
+    snapshot.dump([Org], fileobj)
+    fileobj.seek(0)
+
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as src:
+        lines = src.read().splitlines()
+    header = json.loads(lines[1])
+    Org.objects.all().delete()
+
+    def load(*lines):
+        fileobj = io.BytesIO()
+        with gzip.GzipFile(fileobj=fileobj, mode="wb") as out:
+            out.write(b"\n".join(lines))
+        fileobj.seek(0)
+        return snapshot.load(fileobj)
+
+    # rows before any header
+    with pytest.raises(snapshot.SnapshotError, match="before header"):
+        load(lines[0], lines[2])
+
+    # value the field can not convert
+    columns = json.loads(lines[2])
+    columns["columns"][0] = ["not an id"]
+    with pytest.raises(snapshot.SnapshotError, match="invalid value"):
+        load(lines[0], lines[1], json.dumps(columns).encode("utf-8"))
+
+    # unknown model
+    header["header"]["model"] = "tests.Unknown"
+    with pytest.raises(snapshot.SnapshotError, match="invalid header"):
+        load(lines[0], json.dumps(header).encode("utf-8"))
+
+    assert not Org.objects.exists()
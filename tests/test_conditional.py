@@ -0,0 +1,83 @@
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from django_handleref.conditional import condition
+from tests.models import Org
+
+
+def make_view(**kwargs):
+    calls = []
+
+    @condition(Org.handleref.undeleted(), **kwargs)
+    def view(request, *args, **kwargs):
+        calls.append(request)
+        return HttpResponse("ok")
+
+    return view, calls
+
+
+@pytest.mark.django_db
+def test_condition_collection(django_assert_num_queries):
+    org = Org.objects.create(name="Conditional", status="ok")
+    view, calls = make_view()
+    factory = RequestFactory()
+
+    response = view(factory.get("/"))
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert etag.startswith('W/"')
+    assert response["Last-Modified"]
+
+    # unchanged, answered with 304 without calling the view
+
+    with django_assert_num_queries(1):
+        response = view(factory.get("/", HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 304
+    assert len(calls) == 1
+
+    # changed
+
+    org.name = "Conditional updated"
+    org.save()
+
+    response = view(factory.get("/", HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+    # removed from the collection
+
+    etag = response["ETag"]
+    org.delete(hard=True)
+    response = view(factory.get("/", HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_condition_object():
+    org = Org.objects.create(name="Conditional", status="ok")
+    view, calls = make_view(lookup_url_kwarg="id")
+    factory = RequestFactory()
+
+    response = view(factory.get("/"), id=org.id)
+    etag = response["ETag"]
+    last_modified = response["Last-Modified"]
+
+    response = view(factory.get("/", HTTP_IF_NONE_MATCH=etag), id=org.id)
+    assert response.status_code == 304
+
+    response = view(factory.get("/", HTTP_IF_MODIFIED_SINCE=last_modified), id=org.id)
+    assert response.status_code == 304
+    assert len(calls) == 1
+
+    org.save()
+
+    response = view(factory.get("/", HTTP_IF_NONE_MATCH=etag), id=org.id)
+    assert response.status_code == 200
+
+    # unknown object, passed on to the view
+
+    response = view(factory.get("/", HTTP_IF_NONE_MATCH=etag), id=org.id + 1)
+    assert response.status_code == 200
+    assert not response.has_header("ETag")
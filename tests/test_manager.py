@@ -1,9 +1,20 @@
+import datetime
 import time
+from unittest import mock
 
 import pytest
+import reversion
+from asgiref.sync import async_to_sync
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
+from django_handleref.manager import HandleRefQuerySet, last_change_many
 from tests.models import Org, Sub, Widget
+from tests.reversion_models import VersionedOrg, VersionedSub
 
 
 class ManagerTests(TestCase):
@@ -27,6 +38,26 @@ class ManagerTests(TestCase):
         org = self.orgs[8]
         self.assertEqual(Org.handleref.last_change(), org.updated)
 
+    def test_last_change_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Org.handleref.last_change(), self.orgs[8].updated)
+
+        self.assertIsNone(Widget.handleref.last_change())
+
+    def test_last_change_many(self):
+        self.assertIsNone(last_change_many([]))
+        self.assertIsNone(last_change_many([Sub, Widget]))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(last_change_many([Org, Sub, Widget]), self.orgs[8].updated)
+
+        widget = Widget.objects.create(name="Last change widget")
+        self.assertEqual(last_change_many([Org, Sub, Widget]), widget.updated)
+        self.assertEqual(
+            last_change_many([Org, Widget.handleref.exclude(id=widget.id)]),
+            self.orgs[8].updated,
+        )
+
     def test_since(self):
         org = self.orgs[0]
         t = time.time()
@@ -55,3 +86,343 @@ class ManagerTests(TestCase):
     def test_undeleted(self):
         qset = Org.handleref.undeleted()
         self.assertNotIn(self.orgs[8].id, [o.id for o in qset])
+
+    def test_soft_delete(self):
+        org = Org.objects.create(name="Soft delete org", status="ok")
+        sub1 = Sub.objects.create(name="Soft delete sub 1", status="ok", org=org)
+        sub2 = Sub.objects.create(name="Soft delete sub 2", status="deleted", org=org)
+
+        total, counts = Org.handleref.filter(id=org.id).soft_delete()
+
+        self.assertEqual(total, 2)
+        self.assertEqual(counts, {"tests.Org": 1, "tests.Sub": 1})
+
+        org.refresh_from_db()
+        sub1.refresh_from_db()
+        updated = sub2.updated
+        sub2.refresh_from_db()
+
+        self.assertEqual(org.status, "deleted")
+        self.assertEqual(org.version, 1)
+        self.assertEqual(sub1.status, "deleted")
+        self.assertEqual(sub1.version, 1)
+        self.assertEqual(sub2.version, 0)
+        self.assertEqual(sub2.updated, updated)
+
+        # already deleted, nothing to do
+        self.assertEqual(Org.handleref.filter(id=org.id).soft_delete(), (0, {}))
+
+    def test_soft_delete_batches(self):
+        for i in range(2):
+            org = Org.objects.create(name=f"Batch delete org {i}", status="ok")
+            for j in range(2):
+                Sub.objects.create(
+                    name=f"Batch delete sub {i}.{j}", status="ok", org=org
+                )
+        qset = Org.handleref.filter(name__startswith="Batch delete")
+
+        # savepoint, select orgs, 2 org updates, 2 sub selects (one per
+        # org batch), 4 sub updates, release savepoint
+
+        with self.assertNumQueries(11):
+            total, counts = qset.soft_delete(batch_size=1)
+
+        self.assertEqual(counts, {"tests.Org": 2, "tests.Sub": 4})
+        self.assertFalse(
+            Sub.handleref.filter(name__startswith="Batch delete").undeleted().exists()
+        )
+
+    def test_undelete(self):
+        org = Org.objects.create(name="Undelete org", status="ok")
+        sub = Sub.objects.create(name="Undelete sub", status="ok", org=org)
+        Org.handleref.filter(id=org.id).soft_delete()
+
+        total, counts = Org.handleref.filter(id=org.id).undelete()
+        self.assertEqual(total, 1)
+        self.assertEqual(counts, {"tests.Org": 1})
+
+        org.refresh_from_db()
+        sub.refresh_from_db()
+        self.assertEqual(org.status, "ok")
+        self.assertEqual(org.version, 2)
+        self.assertEqual(sub.status, "deleted")
+
+        Org.handleref.filter(id=org.id).soft_delete()
+        total, counts = Org.handleref.filter(id=org.id).undelete(cascade=True)
+        self.assertEqual(counts, {"tests.Org": 1, "tests.Sub": 1})
+        sub.refresh_from_db()
+        self.assertEqual(sub.status, "ok")
+
+    def test_since_strict(self):
+        qset = Org.handleref.since(timestamp=self.initTime, strict=True)
+        self.assertNotIn(" OR ", str(qset.query))
+        self.assertEqual(
+            sorted(o.id for o in qset),
+            sorted(o.id for o in Org.handleref.since(timestamp=self.initTime)),
+        )
+
+    def test_since_iter(self):
+        qset = Org.handleref.since(timestamp=self.initTime, deleted=True)
+        expected = [o.id for o in qset.order_by("updated", "id")]
+
+        ids = [
+            o.id
+            for o in Org.handleref.since_iter(
+                timestamp=self.initTime, deleted=True, batch_size=3
+            )
+        ]
+        self.assertEqual(ids, expected)
+
+        # undeleted only
+        ids = [o.id for o in Org.handleref.since_iter(timestamp=0, batch_size=3)]
+        self.assertNotIn(self.orgs[8].id, ids)
+        self.assertEqual(len(ids), 8)
+
+    def test_since_iter_resume(self):
+        stream = Org.handleref.since_iter(timestamp=0, deleted=True, batch_size=2)
+        first = [next(stream) for _ in range(3)]
+        cursor = Org.handleref.since_cursor(first[-1])
+
+        rest = list(
+            Org.handleref.since_iter(
+                timestamp=0, deleted=True, batch_size=2, cursor=cursor
+            )
+        )
+        self.assertEqual(
+            [o.id for o in first + rest],
+            [o.id for o in Org.objects.order_by("updated", "id")],
+        )
+
+    def test_async(self):
+        self.assertEqual(
+            async_to_sync(Org.handleref.alast_change)(), Org.handleref.last_change()
+        )
+        self.assertIsNone(async_to_sync(Widget.handleref.alast_change)())
+
+        objects = async_to_sync(Org.handleref.asince)(timestamp=self.initTime)
+        self.assertEqual(
+            sorted(o.id for o in objects),
+            sorted(o.id for o in Org.handleref.since(timestamp=self.initTime)),
+        )
+
+        async def collect(**kwargs):
+            return [o.id async for o in Org.handleref.asince_iter(**kwargs)]
+
+        self.assertEqual(
+            async_to_sync(collect)(timestamp=0, deleted=True, batch_size=3),
+            [o.id for o in Org.handleref.since_iter(timestamp=0, deleted=True)],
+        )
+
+        cursor = Org.handleref.since_cursor(self.orgs[2])
+        self.assertEqual(
+            async_to_sync(collect)(timestamp=0, batch_size=2, cursor=cursor),
+            [o.id for o in Org.handleref.since_iter(timestamp=0, cursor=cursor)],
+        )
+
+
+class LastChangeCacheTests(TestCase):
+    """
+    Test last change watermark caching
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.org = Org.objects.create(name="Cache org", status="ok")
+
+    def test_cache_warm(self):
+        self.assertIsNone(Sub.handleref.last_change())
+        with self.assertNumQueries(0):
+            self.assertIsNone(Sub.handleref.last_change())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sub = Sub.objects.create(name="Cache sub 1", org=self.org, status="ok")
+        with self.assertNumQueries(0):
+            self.assertEqual(Sub.handleref.last_change(), sub.updated)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sub.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(Sub.handleref.last_change(), sub.updated)
+
+    def test_cache_invalidate(self):
+        sub = Sub.objects.create(name="Cache sub 2", org=self.org, status="ok")
+        self.assertEqual(Sub.handleref.last_change(), sub.updated)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sub.handleref.filter(id=sub.id).soft_delete()
+        with self.assertNumQueries(1):
+            last_change = Sub.handleref.last_change()
+        sub.refresh_from_db()
+        self.assertEqual(last_change, sub.updated)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sub.delete(hard=True)
+        with self.assertNumQueries(1):
+            self.assertIsNone(Sub.handleref.last_change())
+
+    def test_cache_invalidate_on_commit(self):
+        sub = Sub.objects.create(name="Cache sub 4", org=self.org, status="ok")
+        last_change = Sub.handleref.last_change()
+
+        # the cached watermark is kept until the transaction commits, so
+        # a concurrent call can not cache the old value after invalidation
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Sub.handleref.filter(id=sub.id).soft_delete()
+            with self.assertNumQueries(0):
+                self.assertEqual(Sub.handleref.last_change(), last_change)
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        with self.assertNumQueries(1):
+            self.assertGreater(Sub.handleref.last_change(), last_change)
+
+    def test_cache_fill_race(self):
+        sub = Sub.objects.create(name="Cache sub 5", org=self.org, status="ok")
+        last_change = HandleRefQuerySet.last_change
+        committed = []
+
+        # a save commits after the cold cache lookup queried the old
+        # watermark but before it is cached
+
+        def last_change_commit(qset):
+            value = last_change(qset)
+            with self.captureOnCommitCallbacks(execute=True):
+                committed.append(
+                    Sub.objects.create(name="Cache sub 6", org=self.org, status="ok")
+                )
+            return value
+
+        with mock.patch.object(HandleRefQuerySet, "last_change", last_change_commit):
+            self.assertEqual(Sub.handleref.last_change(), sub.updated)
+
+        # the old watermark is only cached for last_change_cache_timeout
+
+        self.assertEqual(Sub.handleref.last_change(), sub.updated)
+        timeout = Sub._handleref.last_change_cache_timeout
+        with mock.patch("time.time", return_value=time.time() + timeout + 1):
+            self.assertEqual(Sub.handleref.last_change(), committed[0].updated)
+
+    def test_cache_async(self):
+        sub = Sub.objects.create(name="Cache sub 3", org=self.org, status="ok")
+        self.assertEqual(async_to_sync(Sub.handleref.alast_change)(), sub.updated)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(Sub.handleref.alast_change)(), sub.updated)
+
+    def test_cache_disabled(self):
+        Org.handleref.last_change()
+        with self.assertNumQueries(1):
+            Org.handleref.last_change()
+
+
+@pytest.mark.django_db
+def test_as_of(db):
+    with reversion.create_revision():
+        org = VersionedOrg.objects.create(name="As of", status="ok")
+        sub = VersionedSub.objects.create(name="As of sub", status="ok", org=org)
+
+    time.sleep(0.1)
+    t = datetime.datetime.now()
+    time.sleep(0.1)
+
+    with reversion.create_revision():
+        org.name = "As of updated"
+        org.save()
+        sub.name = "As of sub updated"
+        sub.save()
+
+    with reversion.create_revision():
+        VersionedOrg.objects.create(name="As of later", status="ok")
+
+    objects = list(VersionedOrg.handleref.as_of(t))
+    assert [(o.id, o.name) for o in objects] == [(org.id, "As of")]
+    assert isinstance(objects[0], VersionedOrg)
+    assert objects[0]._state.adding
+
+    objects = list(VersionedOrg.handleref.filter(id=org.id).as_of(t, cascade=True))
+    assert [(o.__class__, o.name) for o in objects] == [
+        (VersionedOrg, "As of"),
+        (VersionedSub, "As of sub"),
+    ]
+
+    objects = list(VersionedOrg.handleref.filter(id=org.id).as_of(time.time()))
+    assert [o.name for o in objects] == ["As of updated"]
+
+
+@pytest.mark.django_db
+def test_as_of_reparented(db):
+    with reversion.create_revision():
+        org_a = VersionedOrg.objects.create(name="As of A", status="ok")
+        org_b = VersionedOrg.objects.create(name="As of B", status="ok")
+        sub = VersionedSub.objects.create(name="As of moved", status="ok", org=org_a)
+
+    time.sleep(0.1)
+    t = datetime.datetime.now()
+    time.sleep(0.1)
+
+    with reversion.create_revision():
+        sub.org = org_b
+        sub.save()
+
+    def as_of(org, timestamp):
+        return [
+            (o.__class__, o.id, getattr(o, "org_id", None))
+            for o in VersionedOrg.handleref.filter(id=org.id).as_of(
+                timestamp, cascade=True
+            )
+        ]
+
+    assert as_of(org_a, t) == [
+        (VersionedOrg, org_a.id, None),
+        (VersionedSub, sub.id, org_a.id),
+    ]
+    assert as_of(org_b, t) == [(VersionedOrg, org_b.id, None)]
+    assert as_of(org_b, time.time()) == [
+        (VersionedOrg, org_b.id, None),
+        (VersionedSub, sub.id, org_b.id),
+    ]
+
+
+@pytest.mark.django_db
+def test_as_of_cascade_candidates(db):
+    with reversion.create_revision():
+        org = VersionedOrg.objects.create(name="As of target", status="ok")
+        other = VersionedOrg.objects.create(name="As of other", status="ok")
+        for i in range(2):
+            VersionedSub.objects.create(name=f"As of target {i}", status="ok", org=org)
+        subs = [
+            VersionedSub.objects.create(name=f"As of other {i}", status="ok", org=other)
+            for i in range(3)
+        ]
+
+    time.sleep(0.1)
+    t = datetime.datetime.now()
+    time.sleep(0.1)
+
+    # children of other parents updated after t are only decoded if
+    # they have a version after t
+
+    VersionedSub.handleref.filter(org=other).soft_delete()
+    with reversion.create_revision():
+        subs[0].name = "As of other renamed"
+        subs[0].save()
+
+    ContentType.objects.clear_cache()
+    qset = VersionedOrg.handleref.filter(id=org.id)
+
+    with mock.patch(
+        "django_handleref.manager.serializers.deserialize",
+        wraps=serializers.deserialize,
+    ) as deserialize:
+        with CaptureQueriesContext(connection) as queries:
+            objects = list(qset.as_of(t, cascade=True))
+
+    assert [o.name for o in objects] == [
+        "As of target",
+        "As of target 0",
+        "As of target 1",
+    ]
+    assert deserialize.call_count == 4
+
+    # content type and versions per model
+    assert len(queries) == 4
@@ -1,6 +1,7 @@
 import time
 
 import pytest
+from django.db import connection
 from django.test import TestCase
 
 from tests.models import Org, Sub, Widget
@@ -25,6 +26,44 @@ class ModelTests(TestCase):
         self.assertEqual("passthrough", widget._handleref.custom_option)
         self.assertEqual("passthrough", Widget.handleref.prop("custom_option"))
 
+    def test_options(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from django_handleref.models import HandleRefOptions
+
+        opts = Org._handleref
+        self.assertEqual(opts.delete_cascade, ("sub_entities",))
+        self.assertEqual(Widget._handleref.extra, {"custom_option": "passthrough"})
+
+        with self.assertRaises(AttributeError):
+            opts.tag = "other"
+
+        with self.assertRaises(AttributeError):
+            opts.nonexistent
+
+        class Invalid:
+            bulk_delete = "yes"
+
+        with self.assertRaises(ImproperlyConfigured):
+            HandleRefOptions(Widget, Invalid)
+
+        class Invalid:
+            delete_cascade = "sub_entities"
+
+        with self.assertRaises(ImproperlyConfigured):
+            HandleRefOptions(Widget, Invalid)
+
+        class Invalid:
+            last_change_cache_timeout = None
+
+        with self.assertRaises(ImproperlyConfigured):
+            HandleRefOptions(Widget, Invalid)
+
+    def test_handle(self):
+        org = Org.objects.create(name="TEST HANDLE", status="ok")
+        self.assertEqual(org.handle, f"org{org.id}")
+        self.assertEqual(org.ref_tag, "org")
+
     def test_soft_delete(self):
         org = Org.objects.create(name="TEST SOFT DELETE", status="ok")
 
@@ -51,3 +90,69 @@ class ModelTests(TestCase):
         org.delete(hard=True)
         with self.assertRaises(Org.DoesNotExist):
             org.refresh_from_db()
+
+    def test_soft_delete_bulk(self):
+        org = Org.objects.create(name="TEST BULK DELETE", status="ok")
+
+        sub1 = Sub.objects.create(name="TEST BULK SUB 1", status="ok", org=org)
+        sub2 = Sub.objects.create(name="TEST BULK SUB 2", status="ok", org=org)
+        sub3 = Sub.objects.create(name="TEST BULK SUB 3", status="deleted", org=org)
+
+        time.sleep(1)
+        u1 = sub1.updated
+        u3 = sub3.updated
+
+        # save org, select children, update children (+ 2 savepoints)
+        with self.assertNumQueries(7):
+            org.delete(bulk=True)
+
+        org.refresh_from_db()
+        self.assertEqual(org.status, "deleted")
+
+        for sub in [sub1, sub2, sub3]:
+            sub.refresh_from_db()
+            self.assertEqual(sub.status, "deleted")
+
+        self.assertGreater(sub1.updated, u1)
+        self.assertEqual(sub1.version, 1)
+        self.assertEqual(sub3.updated, u3)
+        self.assertEqual(sub3.version, 0)
+
+    def test_since_indexes(self):
+        names = [index.name for index in Org._meta.indexes]
+        self.assertEqual(len(names), 4)
+        self.assertEqual(len(set(names)), 4)
+        self.assertEqual(Widget._meta.indexes, [])
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Org._meta.db_table
+            )
+
+        for index in Org._meta.indexes:
+            self.assertIn(index.name, constraints)
+            self.assertEqual(constraints[index.name]["columns"], index.fields)
+
+    def test_registry(self):
+        from django_handleref.models import HandleRefModel, registry
+        from tests.reversion_models import VersionedOrg
+
+        self.assertIs(registry.get_model("widget"), Widget)
+        self.assertEqual(registry.get_models("org"), [Org, VersionedOrg])
+        self.assertIn(Sub, registry.models())
+        self.assertNotIn(HandleRefModel, registry.models())
+
+        with self.assertRaises(ValueError):
+            registry.get_model("org")
+
+        with self.assertRaises(LookupError):
+            registry.get_model("nonexistent")
+
+        self.assertEqual(set(registry.duplicates().keys()), {"org", "sub"})
+
+    def test_check_duplicate_tags(self):
+        from django_handleref.models import check_duplicate_tags
+
+        warnings = check_duplicate_tags()
+        self.assertEqual({w.id for w in warnings}, {"handleref.W001"})
+        self.assertEqual(len(warnings), 2)
@@ -0,0 +1,185 @@
+import json
+
+import pytest
+from django.utils import timezone
+
+pytest.importorskip("rest_framework")
+
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+from rest_framework import mixins, serializers, viewsets  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from django_handleref.rest.serializers import HandleRefSerializer  # noqa: E402
+from django_handleref.rest.views import (  # noqa: E402
+    ChangeFeedViewSet,
+    ConditionalListMixin,
+    ConditionalRetrieveMixin,
+    decode_cursor,
+    encode_cursor,
+)
+from tests.models import Org, Sub  # noqa: E402
+
+
+class OrgSerializer(HandleRefSerializer):
+    class Meta:
+        model = Org
+        fields = ["id", "name", "status", "version", "created", "updated"]
+
+
+class SubSerializer(HandleRefSerializer):
+    sub_handle = serializers.ReadOnlyField(source="handle")
+
+    class Meta:
+        model = Sub
+        fields = [
+            "id",
+            "handle",
+            "org",
+            "name",
+            "status",
+            "version",
+            "created",
+            "updated",
+            "sub_handle",
+        ]
+
+
+class OrgFeedViewSet(ChangeFeedViewSet):
+    queryset = Org.handleref.all()
+    serializer_class = OrgSerializer
+    feed_batch_size = 2
+
+
+class OrgViewSet(
+    ConditionalListMixin,
+    ConditionalRetrieveMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = Org.handleref.undeleted()
+    serializer_class = OrgSerializer
+
+
+def get_feed(**params):
+    request = APIRequestFactory().get("/orgs/feed", params)
+    response = OrgFeedViewSet.as_view({"get": "list"})(request)
+    assert response.status_code == 200
+    return json.loads(b"".join(response.streaming_content))
+
+
+def test_cursor():
+    cursor = (timezone.now(), 5)
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+
+    with pytest.raises(ValueError):
+        decode_cursor("invalid")
+
+
+@pytest.mark.django_db
+def test_change_feed():
+    orgs = [Org.objects.create(name=f"Feed {i}", status="ok") for i in range(5)]
+    orgs[1].delete()
+
+    feed = get_feed()
+    results = feed["results"]
+
+    assert [row["id"] for row in results] == [
+        org.id for org in orgs if org.id != orgs[1].id
+    ] + [orgs[1].id]
+    assert results[-1] == {"id": orgs[1].id, "status": "deleted"}
+    assert results[0]["name"] == "Feed 0"
+    assert feed["watermark"]
+
+    # nothing changed since the watermark
+
+    feed = get_feed(cursor=feed["watermark"])
+    assert feed["results"] == []
+    assert feed["watermark"]
+
+    # only changes since the watermark
+
+    orgs[2].name = "Feed 2 updated"
+    orgs[2].save()
+
+    feed = get_feed(cursor=feed["watermark"])
+    assert [row["name"] for row in feed["results"]] == ["Feed 2 updated"]
+
+
+@pytest.mark.django_db
+def test_change_feed_invalid_params():
+    factory = APIRequestFactory()
+    view = OrgFeedViewSet.as_view({"get": "list"})
+
+    assert view(factory.get("/orgs/feed", {"cursor": "invalid"})).status_code == 400
+    assert view(factory.get("/orgs/feed", {"since": "invalid"})).status_code == 400
+
+
+@pytest.mark.django_db
+def test_dump(django_assert_num_queries):
+    org = Org.objects.create(name="Dump", status="ok")
+    for i in range(5):
+        Sub.objects.create(name=f"Dump {i}", org=org, status="ok")
+
+    qset = Sub.objects.order_by("id")
+    expected = [dict(row) for row in SubSerializer(qset, many=True).data]
+
+    with django_assert_num_queries(1):
+        data = list(SubSerializer.dump(qset))
+
+    assert data == expected
+    assert data[0]["handle"] == f"sub{data[0]['id']}"
+    assert list(data[0].keys()) == list(expected[0].keys())
+
+
+def test_dump_unsupported():
+    class UnsupportedSerializer(HandleRefSerializer):
+        method = serializers.SerializerMethodField()
+
+        class Meta:
+            model = Org
+            fields = ["id", "method"]
+
+    with pytest.raises(ImproperlyConfigured):
+        list(UnsupportedSerializer.dump(Org.objects.all()))
+
+
+@pytest.mark.django_db
+def test_conditional_mixins(django_assert_num_queries):
+    org = Org.objects.create(name="Conditional", status="ok")
+    factory = APIRequestFactory()
+    list_view = OrgViewSet.as_view({"get": "list"})
+    retrieve_view = OrgViewSet.as_view({"get": "retrieve"})
+
+    response = list_view(factory.get("/orgs"))
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    with django_assert_num_queries(1):
+        response = list_view(factory.get("/orgs", HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 304
+
+    response = retrieve_view(factory.get("/orgs/1"), pk=org.id)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    with django_assert_num_queries(1):
+        response = retrieve_view(
+            factory.get("/orgs/1", HTTP_IF_NONE_MATCH=etag), pk=org.id
+        )
+    assert response.status_code == 304
+
+    org.delete()
+
+    response = retrieve_view(factory.get("/orgs/1", HTTP_IF_NONE_MATCH=etag), pk=org.id)
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_handle_not_added():
+    class AllSerializer(HandleRefSerializer):
+        class Meta:
+            model = Org
+            fields = "__all__"
+
+    assert "handle" not in AllSerializer(Org(name="Unsaved")).data
@@ -1,6 +1,7 @@
 import pytest
 
 from django_handleref import util
+from tests.models import Org, Sub
 
 
 def test_split_ref():
@@ -15,3 +16,32 @@ def test_split_ref_exc():
         util.split_ref("asdf123a")
     with pytest.raises(ValueError):
         util.split_ref("123asdf")
+
+
+@pytest.mark.django_db
+def test_resolve_handles(db, django_assert_num_queries):
+    org = Org.objects.create(name="Resolve org")
+    sub = Sub.objects.create(name="Resolve sub", org=org)
+
+    handles = [org.handle, "ORG-%d" % org.id, sub.handle, "sub999999", "bad", "x1"]
+
+    with django_assert_num_queries(2):
+        result = util.resolve_handles(handles, models=[Org, Sub])
+
+    assert result == {
+        org.handle: org,
+        "ORG-%d" % org.id: org,
+        sub.handle: sub,
+        "sub999999": None,
+        "bad": None,
+        "x1": None,
+    }
+
+
+@pytest.mark.django_db
+def test_resolve_handles_ambiguous(db):
+    # Org and VersionedOrg both use the "org" tag
+    with pytest.raises(ValueError):
+        util.resolve_handles(["org1"])
+
+    assert util.resolve_handles(["widget1"]) == {"widget1": None}
@@ -2,14 +2,23 @@ import datetime
 
 import pytest
 import reversion
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from django_handleref.version import (
     Diff,
+    HistoryDiff,
     ReversionReverter,
     ReversionVersion,
+    ReversionVersionChain,
     Reverter,
     Version,
+    VersionDataCache,
 )
+from django_handleref.versiondiff.models import VersionDiff
+from tests.models import Member, Org, Sub
 from tests.reversion_models import VersionedOrg
 
 
@@ -173,3 +182,332 @@ def test_rollback(db, reversion_org):
     org, versions = reversion_org
     reverter = ReversionReverter()
     _test_rollback(org, versions, reverter)
+
+
+@pytest.mark.django_db
+def test_reversion_version_bump_batched(db):
+    with CaptureQueriesContext(connection) as queries:
+        with reversion.create_revision():
+            org_a = VersionedOrg.objects.create(name="Batch A", status="ok")
+            org_b = VersionedOrg.objects.create(name="Batch B", status="ok")
+
+    table = VersionedOrg._meta.db_table
+    updates = [q for q in queries if q["sql"].startswith(f'UPDATE "{table}"')]
+    assert len(updates) == 1
+
+    org_a.refresh_from_db()
+    org_b.refresh_from_db()
+    assert org_a.version == 1
+    assert org_b.version == 1
+
+
+@pytest.mark.django_db
+def test_version_chain(db, reversion_org):
+    org, versions = reversion_org
+    version_a, version_b, version_c = versions
+
+    with CaptureQueriesContext(connection) as queries:
+        chain = ReversionVersionChain.for_object(org)
+    assert len(queries) == 1
+
+    assert [v.id for v in chain] == [v.id for v in versions]
+    assert len(chain) == 3
+
+    with CaptureQueriesContext(connection) as queries:
+        assert chain[0].previous is None
+        assert chain[1].previous.id == version_a.id
+        assert chain[1].next.id == version_c.id
+        assert chain[2].next.version is None
+        assert chain.get(version_b.id).data["name"] == "Updated"
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_version_chain_link(db, reversion_org_many):
+    org, versions = reversion_org_many
+
+    page = [ReversionVersion(v.version) for v in versions[50:60]]
+
+    with CaptureQueriesContext(connection) as queries:
+        ReversionVersionChain.link(page)
+    assert len(queries) == 1
+
+    with CaptureQueriesContext(connection) as queries:
+        for version, expected in zip(page, versions[49:59]):
+            assert version.previous.id == expected.id
+    assert len(queries) == 0
+
+    first = ReversionVersion(versions[0].version)
+    ReversionVersionChain.link([first])
+    assert first.previous is None
+
+
+@pytest.mark.django_db
+def test_reversion_version_data_fields(db, reversion_org):
+    org, versions = reversion_org
+    version = ReversionVersion(versions[2].id)
+
+    data = version.data_fields(["id", "name", "website", "created", "unknown"])
+    assert version._data is None
+    assert data == {
+        "id": org.id,
+        "name": "Again",
+        "website": "http://localhost",
+        "created": version.data["created"],
+    }
+    assert version.data_fields(["name", "status"]) == {
+        "name": "Again",
+        "status": "ok",
+    }
+
+
+@pytest.mark.django_db
+def test_reversion_version_data_cache(db, reversion_org):
+    org, versions = reversion_org
+    cache = VersionDataCache(maxsize=2)
+
+    ReversionVersion.data_cache = cache
+    try:
+        for version in versions:
+            ReversionVersion(version.version).data
+
+        assert list(cache.entries.keys()) == [versions[1].id, versions[2].id]
+
+        version = ReversionVersion(versions[2].version)
+        assert version.data is cache.get(versions[2].id)
+        assert version.data_fields(["name"]) == {"name": "Again"}
+    finally:
+        ReversionVersion.data_cache = None
+
+
+@pytest.mark.django_db
+def test_history_diff(db, reversion_org):
+    org, versions = reversion_org
+    version_a, version_b, version_c = versions
+
+    changes = HistoryDiff(versions).changes
+    assert changes == [
+        None,
+        Diff(version_a, version_b).changes,
+        Diff(version_b, version_c).changes,
+    ]
+    assert changes[2] == {
+        "name": {"old": "Updated", "changed": "Again"},
+        "website": {"old": "", "changed": "http://localhost"},
+    }
+
+    changes = HistoryDiff([version_b, version_c], previous=version_a).changes
+    assert changes == [
+        Diff(version_a, version_b).changes,
+        Diff(version_b, version_c).changes,
+    ]
+
+    assert HistoryDiff([]).changes == []
+
+
+@pytest.mark.django_db
+def test_version_diff_persisted(db, reversion_org):
+    org, versions = reversion_org
+    version_a, version_b, version_c = versions
+
+    diff = VersionDiff.objects.get(version_id=version_b.id)
+    assert diff.previous_version_id == version_a.id
+    assert diff.changes == {"name": {"old": "Test", "changed": "Updated"}}
+    assert VersionDiff.objects.get(version_id=version_a.id).changes is None
+
+    # changes are read from the persisted diff
+    diff.changes = {"name": {"old": "Stored", "changed": "Updated"}}
+    diff.save()
+
+    version = ReversionVersion(version_b.id)
+    assert version.changes(version_a) == diff.changes
+    assert version.changed_fields(version_a) == ["name"]
+
+    # persisted changes only apply to the version they were computed against
+    assert version.changes(version_c) != diff.changes
+
+    versions = [ReversionVersion(v.id) for v in versions]
+    ReversionVersionChain.link(versions)
+    with CaptureQueriesContext(connection) as queries:
+        ReversionVersion.prefetch_changes(versions)
+        changes = HistoryDiff(versions[1:], previous=versions[0]).changes
+    assert len(queries) == 1
+    assert changes[0] == diff.changes
+
+
+@pytest.mark.django_db
+def test_version_diff_revision_query_count(db):
+    def revision_queries(count):
+        orgs = list(
+            VersionedOrg.objects.filter(name__startswith=f"Diff {count} ").order_by(
+                "id"
+            )
+        )
+        with CaptureQueriesContext(connection) as queries:
+            with reversion.create_revision():
+                for org in orgs:
+                    org.name = f"{org.name} updated"
+                    org.save()
+        return len(queries)
+
+    for count in (2, 20):
+        with reversion.create_revision():
+            for i in range(count):
+                VersionedOrg.objects.create(name=f"Diff {count} {i}", status="ok")
+
+    # only the saves themselves scale with the number of objects, storing
+    # the diffs of the revision does not query per object
+
+    assert revision_queries(20) - revision_queries(2) == 18
+
+    org = VersionedOrg.objects.get(name="Diff 20 5 updated")
+    versions = reversion.models.Version.objects.get_for_object(org).order_by("id")
+    diff = VersionDiff.objects.get(version_id=versions[1].id)
+    assert diff.previous_version_id == versions[0].id
+    assert diff.changed_fields == ["name"]
+
+
+@pytest.mark.django_db
+def test_version_chain_link_previous(db, reversion_org_many):
+    org, versions = reversion_org_many
+
+    page = [ReversionVersion(versions[i].version) for i in (0, 1, 50, 51, 150)]
+
+    with CaptureQueriesContext(connection) as queries:
+        ReversionVersionChain.link_previous(page)
+    assert len(queries) == 2
+
+    assert page[0].previous is None
+    assert [v.previous.id for v in page[1:]] == [
+        versions[i].id for i in (0, 49, 50, 149)
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_rollback(db):
+    orgs = []
+    for i in range(3):
+        with reversion.create_revision():
+            org = VersionedOrg.objects.create(name=f"Bulk {i}", status="ok")
+        with reversion.create_revision():
+            org.name = f"Bulk {i} corrupted"
+            org.save()
+        orgs.append(org)
+
+    # make the first version of the last org clash with the name
+    # of another org
+    with reversion.create_revision():
+        orgs[0].name = "Bulk 2"
+        orgs[0].save()
+
+    pairs = []
+    for org in orgs[1:]:
+        versions = reversion.models.Version.objects.get_for_object(org)
+        first = ReversionVersion(versions.order_by("id").first())
+        pairs.append((VersionedOrg.objects.get(id=org.id), first))
+
+    version = pairs[0][0].version
+    revisions = reversion.models.Revision.objects.count()
+
+    reverter = ReversionReverter()
+    rolled_back, failed = reverter.bulk_rollback(pairs, batch_size=1)
+
+    assert [org.id for org in rolled_back] == [orgs[1].id]
+    assert [org.id for org in failed.keys()] == [orgs[2].id]
+    assert "name" in list(failed.values())[0].message_dict
+
+    assert reversion.models.Revision.objects.count() == revisions + 1
+
+    orgs[1].refresh_from_db()
+    assert orgs[1].name == "Bulk 1"
+    assert orgs[1].version == version + 1
+
+    orgs[2].refresh_from_db()
+    assert orgs[2].name == "Bulk 2 corrupted"
+
+
+@pytest.mark.django_db
+def test_bulk_rollback_unique_conflict(django_capture_on_commit_callbacks):
+    class DataVersion(Version):
+        @property
+        def data(self):
+            return self.version
+
+    cache.clear()
+
+    org = Org.objects.create(name="Conflict org", status="ok")
+    subs = [
+        Sub.objects.create(name=f"Conflict sub {i}", org=org, status="ok")
+        for i in range(3)
+    ]
+    last_change = Sub.handleref.last_change()
+
+    # the first two subs are rolled back to the same name, each passes
+    # validation on its own
+
+    pairs = [
+        (subs[0], DataVersion({"name": "Conflict"})),
+        (subs[1], DataVersion({"name": "Conflict"})),
+        (subs[2], DataVersion({"name": "Conflict 2"})),
+    ]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        rolled_back, failed = Reverter().bulk_rollback(pairs)
+
+    assert rolled_back == [subs[0], subs[2]]
+    assert list(failed.keys()) == [subs[1]]
+    assert isinstance(failed[subs[1]], ValidationError)
+
+    assert sorted(Sub.objects.values_list("name", flat=True)) == [
+        "Conflict",
+        "Conflict 2",
+        "Conflict sub 1",
+    ]
+
+    # the cached last change is invalidated after a bulk_update
+
+    last_change = Sub.handleref.last_change()
+    with django_capture_on_commit_callbacks(execute=True):
+        rolled_back, failed = Reverter().bulk_rollback(
+            [(subs[1], DataVersion({"name": "Conflict 3"}))]
+        )
+    assert rolled_back == [subs[1]]
+    assert Sub.handleref.last_change() > last_change
+
+
+@pytest.mark.django_db
+def test_validate_status_changes(db):
+    org = Org.objects.create(name="Deleted parent", status="deleted")
+    org_ok = Org.objects.create(name="Ok parent", status="ok")
+    subs = [
+        Sub.objects.create(name=f"Status sub {i}", status="deleted", org=org)
+        for i in range(3)
+    ]
+    sub_ok = Sub.objects.create(name="Status sub ok", status="deleted", org=org_ok)
+
+    reverter = Reverter()
+
+    with pytest.raises(ValidationError):
+        reverter.validate_status_change(subs[0], "ok")
+    reverter.validate_status_change(subs[0], "deleted")
+    reverter.validate_status_change(sub_ok, "ok")
+
+    changes = [(sub, "ok") for sub in subs + [sub_ok]]
+    with CaptureQueriesContext(connection) as queries:
+        errors = reverter.validate_status_changes(changes)
+    assert len(queries) == 1
+    assert set(errors.keys()) == set(subs)
+    assert "non_field_errors" in errors[subs[0]].message_dict
+
+
+@pytest.mark.django_db
+def test_validate_status_changes_to_field(db):
+    # parents referenced by a field other than the primary key
+
+    org = Org.objects.create(name="Deleted member parent", status="deleted")
+    org_ok = Org.objects.create(name="Ok member parent", status="ok")
+    member = Member.objects.create(name="Member", status="deleted", org=org)
+    member_ok = Member.objects.create(name="Member ok", status="deleted", org=org_ok)
+
+    errors = Reverter().validate_status_changes([(member, "ok"), (member_ok, "ok")])
+    assert list(errors.keys()) == [member]
@@ -1,6 +1,13 @@
 import pytest
+import reversion
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from tests.reversion_models import VersionedOrg
+
 
 def _test_view_object_history(org, versions, user, client):
     opts = org._meta
@@ -114,3 +121,92 @@ def test_view_version_rollback(db, superuser, reversion_org):
 @pytest.mark.django_db
 def test_view_version_rollback_process(db, superuser, reversion_org):
     _test_view_version_rollback_process(*reversion_org, **superuser)
+
+
+@pytest.mark.django_db
+def test_view_object_history_keyset_pagination(db, superuser, reversion_org_many):
+    org, versions = reversion_org_many
+    client = superuser["client"]
+    cache.clear()
+    opts = org._meta
+    url = reverse(f"admin:{opts.app_label}_{opts.model_name}_history", args=(org.id,))
+
+    response = client.get(url)
+    listing = response.context["listing"]
+    assert len(listing.result_list) == 100
+    assert listing.result_count == len(versions)
+    assert listing.has_older
+    assert not listing.has_newer
+
+    response = client.get(url + listing.older_query)
+    listing = response.context["listing"]
+    assert len(listing.result_list) == len(versions) - 100
+    assert listing.result_list[-1].id == versions[0].id
+    assert not listing.has_older
+    assert listing.has_newer
+
+    response = client.get(url + listing.newer_query)
+    listing = response.context["listing"]
+    assert len(listing.result_list) == 100
+    assert listing.result_list[0].id == versions[-1].id
+    assert not listing.has_newer
+
+
+def _history_queries(org, client):
+    opts = org._meta
+    url = reverse(f"admin:{opts.app_label}_{opts.model_name}_history", args=(org.id,))
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+@pytest.mark.django_db
+def test_view_object_history_query_count(db, superuser):
+    cache.clear()
+    client = superuser["client"]
+
+    with reversion.create_revision():
+        org_a = VersionedOrg.objects.create(name="Query count A", status="ok")
+        reversion.set_user(superuser["user"])
+    with reversion.create_revision():
+        org_b = VersionedOrg.objects.create(name="Query count B", status="ok")
+        reversion.set_user(superuser["user"])
+
+    for i in range(0, 20):
+        with reversion.create_revision():
+            reversion.set_user(superuser["user"])
+            reversion.set_comment(f"update {i}")
+            org_b.name = f"Query count B {i}"
+            org_b.save()
+
+    assert _history_queries(org_a, client) == _history_queries(org_b, client)
+
+
+@pytest.mark.django_db
+def test_view_object_history_query_count_no_data(db, superuser, monkeypatch):
+    cache.clear()
+    client = superuser["client"]
+
+    # neither object data nor changes listed, the version snapshots
+    # are not loaded and no diffs are computed
+
+    model_admin = admin.site._registry[VersionedOrg]
+    monkeypatch.setattr(
+        model_admin,
+        "version_list_fields",
+        [("version_id", "Version ID"), ("version_date", "Date")],
+    )
+
+    with reversion.create_revision():
+        org_a = VersionedOrg.objects.create(name="No data A", status="ok")
+    with reversion.create_revision():
+        org_b = VersionedOrg.objects.create(name="No data B", status="ok")
+
+    for i in range(0, 20):
+        with reversion.create_revision():
+            org_b.name = f"No data B {i}"
+            org_b.save()
+
+    assert _history_queries(org_a, client) == _history_queries(org_b, client)
+    assert "serialized_data" not in str(model_admin.history_query_set(org_b.id).query)